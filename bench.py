@@ -0,0 +1,231 @@
+# bench.py
+# End-to-end benchmark against mock_gold.py: runs check_class_status (and
+# optionally the HTTP engine), login_cas and duo_auth_hopt for a number of
+# cycles and reports latency percentiles, Python and Chromium CPU and peak
+# Chromium RSS. With --out the result is appended as one JSON line together
+# with the commit it was measured on, so runs can be compared across commits.
+#
+#   python bench.py --cycles 50 --auth-cycles 5 --engine both --out bench.jsonl
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import subprocess
+import tempfile
+import threading
+import time
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the scanner against the local GOLD/CAS/Duo mock")
+    parser.add_argument('--cycles', type=int, default=30, help="poll cycles per engine")
+    parser.add_argument('--auth-cycles', type=int, default=3, help="full CAS + Duo logins, each in a fresh context")
+    parser.add_argument('--engine', choices=["browser", "http", "both"], default="browser")
+    parser.add_argument('--courses', type=int, default=1, help="courses in the bench watchlist")
+    parser.add_argument('--port', type=int, default=8800)
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds the mock adds to every response")
+    parser.add_argument('--churn', type=float, default=0.0, help="chance per section per render that its seat count moves")
+    parser.add_argument('--sections', type=int, default=12, help="sections per course on the mock")
+    parser.add_argument('--governor-rate', type=float, default=0,
+                        help="GOVERNOR_RATE for the run, requests per minute (default off, so latency isn't throttled)")
+    parser.add_argument('--headed', action='store_true')
+    parser.add_argument('--out', help="append the result as a JSON line to this file")
+    return parser.parse_args()
+
+
+def configure_env(args, workdir):
+    """Point config.py at the mock. Has to run before config is imported."""
+    os.environ['GOLD_URL'] = f"http://127.0.0.1:{args.port}/gold"
+    os.environ['CAS_LOGIN_URL'] = "/cas/login"
+    os.environ['MOCK_LATENCY'] = str(args.latency)
+    os.environ['MOCK_CHURN'] = str(args.churn)
+    os.environ['MOCK_SECTIONS'] = str(args.sections)
+    # config.py reads these at import, the mock doesn't care about their values
+    for key in ['HOPT_KEY', 'keyIdentifier', 'keyValue', 'credentialIdPadded', 'userHandle',
+                'email_addr', 'email_password', 'username', 'passwd']:
+        os.environ.setdefault(key, 'bench')
+    for key in ['HOPT_COUNTER', 'counter']:
+        os.environ.setdefault(key, '0')
+    os.chdir(workdir)
+
+
+def start_mock(port):
+    import uvicorn
+    import mock_gold
+    server = uvicorn.Server(uvicorn.Config(mock_gold.app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+def percentile(samples, p):
+    """Nearest-rank percentile of a sorted list."""
+    return samples[max(0, math.ceil(p / 100 * len(samples)) - 1)]
+
+
+class Recorder:
+    """Latencies, CPU and peak RSS of one benchmarked call."""
+
+    def __init__(self):
+        self.samples = []
+        self.failures = 0
+        self.python_cpu = 0.0
+        self.browser_cpu = 0.0
+        self.peak_rss = 0
+
+    async def measure(self, call):
+        import metrics
+        cpu, browser_cpu = time.process_time(), metrics.browser_cpu_seconds() or 0.0
+        started = time.perf_counter()
+        try:
+            ok = await call()
+        except Exception as e:
+            print(f"Bench call raised: {e}")
+            ok = False
+        self.samples.append(time.perf_counter() - started)
+        self.python_cpu += time.process_time() - cpu
+        # only live Chromium processes are counted, renderers of closed contexts drop out
+        self.browser_cpu += max(0.0, (metrics.browser_cpu_seconds() or 0.0) - browser_cpu)
+        self.peak_rss = max(self.peak_rss, metrics.browser_rss_bytes() or 0)
+        if ok is False:
+            self.failures += 1
+        return ok
+
+    def report(self) -> dict:
+        if not self.samples:
+            return {"n": 0}
+        samples = sorted(self.samples)
+        return {
+            "n": len(samples),
+            "failures": self.failures,
+            "p50_ms": round(percentile(samples, 50) * 1000, 1),
+            "p90_ms": round(percentile(samples, 90) * 1000, 1),
+            "p99_ms": round(percentile(samples, 99) * 1000, 1),
+            "mean_ms": round(sum(samples) / len(samples) * 1000, 1),
+            "python_cpu_ms_per_call": round(self.python_cpu / len(samples) * 1000, 2),
+            "browser_cpu_ms_per_call": round(self.browser_cpu / len(samples) * 1000, 2),
+            "peak_browser_rss_mb": round(self.peak_rss / 2 ** 20, 1),
+        }
+
+
+async def bench_auth(browser, tenant, cycles):
+    """Full logins in fresh contexts, so every one goes through the CAS form and the Duo iframe."""
+    import utils
+    login, duo = Recorder(), Recorder()
+
+    duo_auth_hopt = utils.duo_auth_hopt
+
+    async def timed_duo(page, context, tenant):
+        return await duo.measure(lambda: duo_auth_hopt(page, context, tenant))
+
+    utils.duo_auth_hopt = timed_duo
+    try:
+        for _ in range(cycles):
+            context = await browser.new_context()
+            page = await context.new_page()
+            await login.measure(lambda: utils.login_cas(page, context, tenant))
+            await context.close()
+    finally:
+        utils.duo_auth_hopt = duo_auth_hopt
+    return login.report(), duo.report()
+
+
+async def bench_polls(call, cycles):
+    recorder = Recorder()
+    for _ in range(cycles):
+        await recorder.measure(call)
+    return recorder.report()
+
+
+async def run(args):
+    import config
+    import mock_gold
+    import tenants
+    import utils
+    from playwright.async_api import async_playwright
+
+    # after config's load_dotenv, so a .env with real SMTP settings can't send bench mail to a real inbox
+    config.SMTP_HOST, config.SMTP_PORT, config.SMTP_STARTTLS, config.SMTP_LOGIN = '127.0.0.1', 1025, False, False
+    config.GOVERNOR_RATE = args.governor_rate
+    if not config.GOLD_URL.startswith("http://127.0.0.1"):
+        raise Exception(f"GOLD_URL is set to {config.GOLD_URL} in .env, the bench only runs against the mock.")
+
+    start_mock(args.port)
+    courses = [("20251", "PSTAT", number) for number in ["120B", "120A", "126", "160A", "109", "10"][:args.courses]]
+    watchlist = {course: [row[0] for row in mock_gold.state.sections(course)[:2]] for course in courses}
+    tenant = tenants.Tenant(
+        name="bench",
+        username=mock_gold.MOCK_USERNAME,
+        passwd=mock_gold.MOCK_PASSWORD,
+        hopt_key=mock_gold.MOCK_HOTP_KEY,
+        hopt_counter=0,
+        to_email=config.to_email,
+        cookies_path="cookies-bench.json",
+        watchlist=watchlist,
+    )
+
+    results = {}
+    async with async_playwright() as playwright:
+        browser = await playwright.chromium.launch(headless=not args.headed)
+        try:
+            if args.auth_cycles:
+                results["login_cas"], results["duo_auth_hopt"] = await bench_auth(browser, tenant, args.auth_cycles)
+
+            context = await browser.new_context()
+            page = await context.new_page()
+            if args.engine in ("browser", "both"):
+                results["check_class_status"] = await bench_polls(
+                    lambda: utils.check_class_status(page, context, tenant), args.cycles)
+
+            if args.engine in ("http", "both"):
+                import httpengine
+                # the HTTP engine rides on the browser's session, make sure there is one
+                if not await utils.login_cas(page, context, tenant):
+                    raise Exception("Could not log in to the mock for the HTTP engine.")
+                await utils.save_cookies(context, tenant)
+                poller = httpengine.HttpPoller(tenant)
+                await poller.load_cookies()
+                results["http_poll"] = await bench_polls(poller.poll, args.cycles)
+                await poller.close()
+            await context.close()
+        finally:
+            await browser.close()
+
+    results["mock"] = {"hotp_counter": mock_gold.state.hotp_counter, **mock_gold.state.counts}
+    return results
+
+
+def git_commit(repo):
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=repo, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    args = parse_args()
+    repo = os.path.dirname(os.path.abspath(__file__))
+    out = os.path.abspath(args.out) if args.out else None
+    with tempfile.TemporaryDirectory(prefix="gold-bench-") as workdir:
+        # history db, HOTP counters, cookie jar and captures of the run stay out of the real ones
+        configure_env(args, workdir)
+        results = asyncio.run(run(args))
+
+    record = {
+        "commit": git_commit(repo),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "args": {key: value for key, value in vars(args).items() if key not in ("out", "headed")},
+        "results": results,
+    }
+    print(json.dumps(record, indent=2))
+    if out:
+        with open(out, 'a') as f:
+            f.write(json.dumps(record) + "\n")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+# browserd.py
+# Keeps one Chromium up across scanner restarts. The scanner attaches to it
+# over CDP (BROWSER_CDP_URL) instead of launching a cold browser each time;
+# contexts the scanner opens are dropped when it disconnects, the browser
+# stays. Cookies still come from the scanner's jar, so nothing is shared
+# between runs that the jar wouldn't carry anyway.
+#
+#   python browserd.py &
+#   BROWSER_CDP_URL=http://127.0.0.1:9222 python main.py
+
+import asyncio
+import os
+import config
+from playwright.async_api import async_playwright
+
+
+async def serve():
+    async with async_playwright() as p:
+        browser = await p.chromium.launch(
+            headless=config.HEADLESS,
+            args=[f"--remote-debugging-port={config.BROWSER_DAEMON_PORT}", "--remote-debugging-address=127.0.0.1"])
+        with open(config.BROWSER_DAEMON_PID_FILE, 'w') as f:
+            f.write(str(os.getpid()))
+        print(f"Chromium {browser.version} listening on http://127.0.0.1:{config.BROWSER_DAEMON_PORT}")
+
+        closed = asyncio.Event()
+        browser.on("disconnected", lambda _: closed.set())
+        try:
+            # until killed, or until Chromium itself goes away
+            await closed.wait()
+            print("Chromium exited")
+        finally:
+            if os.path.exists(config.BROWSER_DAEMON_PID_FILE):
+                os.remove(config.BROWSER_DAEMON_PID_FILE)
+            if browser.is_connected():
+                await browser.close()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
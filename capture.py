@@ -0,0 +1,62 @@
+# capture.py
+# Debug captures of the pages we step through. By default they are DOM snapshots
+# kept in a small in-memory ring per tenant and only written out by
+# utils.handle_error, so a healthy poll never touches the disk.
+
+import asyncio
+import os
+from collections import deque
+from datetime import datetime
+import config
+
+# tenant name -> deque of (time, step name, url, html)
+_rings = {}
+
+
+def _ring(tenant):
+    name = tenant.name if tenant else "default"
+    if name not in _rings:
+        _rings[name] = deque(maxlen=config.CAPTURE_RING_SIZE)
+    return _rings[name]
+
+
+def new_cycle(tenant):
+    """Forget the captures of the previous poll cycle."""
+    _ring(tenant).clear()
+
+
+async def snap(target, name, tenant):
+    """Capture a Page or Frame at one step of the flow, according to config.CAPTURE_MODE."""
+    if config.CAPTURE_MODE == "always":
+        # old behaviour, a PNG per step, prefixed so tenants sharing the browser don't overwrite each other's
+        os.makedirs('./screenshots', exist_ok=True)
+        page = getattr(target, 'page', target)  # a Frame screenshots through its page
+        owner = tenant.name if tenant else "default"
+        await page.screenshot(path=f'./screenshots/{owner}-{name}.png')
+    elif config.CAPTURE_MODE == "failure":
+        try:
+            html = await target.content()
+        except Exception as e:
+            html = f"<!-- snapshot failed: {e} -->"
+        _ring(tenant).append((datetime.now(), name, target.url, html))
+
+
+async def flush(tenant):
+    """Write the current cycle's snapshots to disk, returns the directory or None."""
+    ring = _ring(tenant)
+    if not ring:
+        return None
+    entries = list(ring)
+    ring.clear()
+
+    name = tenant.name if tenant else "default"
+    directory = f"./screenshots/failure-{name}-{datetime.now():%Y%m%d-%H%M%S}"
+
+    def write():
+        os.makedirs(directory, exist_ok=True)
+        for i, (taken_at, step, url, html) in enumerate(entries):
+            with open(os.path.join(directory, f"{i:02d}-{step}.html"), 'w') as f:
+                f.write(f"<!-- {taken_at} {url} -->\n{html}")
+
+    await asyncio.to_thread(write)
+    return directory
@@ -0,0 +1,220 @@
+# catalog.py
+# Subject-wide scans for "any open section of any upper-division PSTAT course"
+# style watches. One search per (quarter, subject area) with an empty course
+# number, streamed through results_parser.StreamingResultsParser into a shared
+# in-memory index of compact CatalogEntry tuples. A subject's entries are
+# replaced wholesale by each scan and the whole index is capped at
+# CATALOG_MAX_SECTIONS, so memory stays bounded however big a department is.
+#
+# A tenant's queries are the "catalog" list of its watchlist.json entry:
+#   {"quarter": "20251", "subject": "PSTAT", "min_course": 100, "max_course": 199,
+#    "days": "MTWR", "after": "10:00", "before": "18:00"}
+# Open sections matching a query are mailed once each; unlike a watched
+# section they don't end the tenant's run.
+
+import asyncio
+import re
+import threading
+import time
+from typing import NamedTuple
+import config
+import governor
+import metrics
+import notifier
+import tracer
+import utils
+from results_parser import SectionRow
+
+CATALOG_SECTIONS = metrics.Gauge("scanner_catalog_sections", "Sections held in the catalog index")
+
+COURSE_NUMBER_RE = re.compile(r'(\d+)')
+TIME_RE = re.compile(r'(\d{1,2}):(\d{2})\s*([AaPp])')
+
+
+class CatalogEntry(NamedTuple):
+    quarter: str
+    subject: str
+    course: str  # course number as GOLD shows it, e.g. "120B"
+    row: SectionRow
+
+    @property
+    def level(self):
+        """Numeric part of the course number, 120 for "120B", None if there is none."""
+        match = COURSE_NUMBER_RE.match(self.course)
+        return int(match.group(1)) if match else None
+
+    @property
+    def times(self):
+        """(start, end) in minutes after midnight, None when the time column is missing or unreadable."""
+        found = TIME_RE.findall(self.row.time or "")
+        if len(found) < 2:
+            return None
+        return tuple(to_minutes(*time_of_day) for time_of_day in found[:2])
+
+    def __str__(self):
+        return f"{self.subject} {self.course} | {self.row} | {self.row.days} {self.row.time or ''} | {self.row.instructor}"
+
+
+def to_minutes(hour, minute, meridiem="") -> int:
+    hour, minute = int(hour), int(minute)
+    if meridiem.lower() == "p" and hour != 12:
+        hour += 12
+    elif meridiem.lower() == "a" and hour == 12:
+        hour = 0
+    return hour * 60 + minute
+
+
+def course_number(title, subject) -> str:
+    """"PSTAT 120B - PROBABILITY & STATS" -> "120B" for subject "PSTAT"."""
+    title = ' '.join((title or "").split())
+    if title.upper().startswith(subject.upper()):
+        title = title[len(subject):]
+    parts = title.split()
+    return parts[0] if parts else ""
+
+
+class CatalogIndex:
+    """Latest scan of every (quarter, subject), keyed by section. Read from the health server thread too."""
+
+    def __init__(self, max_sections=None):
+        self.max_sections = max_sections or config.CATALOG_MAX_SECTIONS
+        self.subjects = {}  # (quarter, subject) -> {section: CatalogEntry}
+        self.scanned_at = {}  # (quarter, subject) -> unix time
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return sum(len(entries) for entries in self.subjects.values())
+
+    def room(self, quarter, subject) -> int:
+        """Sections a new scan of this subject may hold, what the other subjects leave of the cap."""
+        with self.lock:
+            others = sum(len(entries) for key, entries in self.subjects.items() if key != (quarter, subject))
+        return max(0, self.max_sections - others)
+
+    def replace(self, quarter, subject, entries):
+        with self.lock:
+            self.subjects[(quarter, subject)] = entries
+            self.scanned_at[(quarter, subject)] = time.time()
+        CATALOG_SECTIONS.set(len(self))
+
+    def query(self, quarter=None, subject=None, min_course=None, max_course=None,
+              open_only=False, days=None, after=None, before=None) -> list:
+        """Entries matching every given filter.
+
+        `days` are the allowed meeting days ("MTWR" = no Friday classes), `after`/`before` bound the
+        start/end time as "HH:MM" (24h). Sections without readable days/times don't pass those filters.
+        """
+        after = to_minutes(*after.split(':')) if after else None
+        before = to_minutes(*before.split(':')) if before else None
+        with self.lock:
+            candidates = [
+                entry for key, entries in self.subjects.items()
+                if (quarter is None or key[0] == quarter) and (subject is None or key[1] == subject.upper())
+                for entry in entries.values()
+            ]
+
+        matches = []
+        for entry in candidates:
+            if open_only and not entry.row.has_vacancy:
+                continue
+            if min_course is not None or max_course is not None:
+                level = entry.level
+                if level is None or (min_course is not None and level < min_course) \
+                        or (max_course is not None and level > max_course):
+                    continue
+            if days is not None:
+                meets = set((entry.row.days or "").replace(' ', ''))
+                if not meets or not meets <= set(days.upper()):
+                    continue
+            if after is not None or before is not None:
+                times = entry.times
+                if times is None or (after is not None and times[0] < after) \
+                        or (before is not None and times[1] > before):
+                    continue
+            matches.append(entry)
+        return matches
+
+
+_index = None
+
+
+def index() -> CatalogIndex:
+    global _index
+    if _index is None:
+        _index = CatalogIndex()
+    return _index
+
+
+class CatalogScanner:
+    """Scans the subjects in a tenant's catalog queries every CATALOG_INTERVAL and mails new open matches."""
+
+    def __init__(self, tenant):
+        self.tenant = tenant
+        # over HTTP with the browser's saved cookies, a subject page is too big to be worth a DOM
+        self.poller = None
+
+    async def scan(self, quarter, subject) -> int:
+        room = index().room(quarter, subject)
+        entries = {}
+        dropped = 0
+
+        def on_row(title, row):
+            nonlocal dropped
+            if row.section in entries:
+                return
+            if len(entries) >= room:
+                dropped += 1
+                return
+            entries[row.section] = CatalogEntry(quarter, subject, course_number(title, subject), row)
+
+        rows = await self.poller.scan(quarter, subject, on_row)
+        if dropped:
+            print(f"[{self.tenant.name}] Catalog index full, {dropped} sections of {subject} {quarter} not kept")
+        index().replace(quarter, subject, entries)
+        tracer.event(f"{subject} {quarter}: {rows} rows, {len(entries)} sections")
+        return len(entries)
+
+    async def check(self):
+        """Rescan every subject the tenant's queries need and notify about new open matches."""
+        # "quarter": 20251 in the JSON is the same quarter as "20251"
+        queries = [dict(q, quarter=str(q["quarter"]), subject=q["subject"].upper()) for q in self.tenant.catalog]
+        for quarter, subject in sorted({(q["quarter"], q["subject"]) for q in queries}):
+            await self.scan(quarter, subject)
+
+        found = []
+        for query in queries:
+            for entry in index().query(open_only=True, **query):
+                if entry.row.section not in self.tenant.catalog_notified:
+                    self.tenant.catalog_notified.add(entry.row.section)
+                    found.append(entry)
+        if found:
+            metrics.VACANCIES.inc(len(found), tenant=self.tenant.name)
+            body = "\n".join(str(entry) for entry in found)
+            print(f"[{self.tenant.name}] Catalog matches:\n{body}")
+            notifier.get().vacancy(
+                f"{len(found)} open section(s) matching your GOLD catalog watch",
+                "Open sections matching your catalog watch, check GOLD to register:\n" + body, self.tenant.to_email)
+
+    async def run(self):
+        # httpx only gets imported for tenants that scan
+        import httpengine
+        while True:
+            if self.tenant.catalog:
+                if self.poller is None:
+                    self.poller = httpengine.HttpPoller(self.tenant)
+                    await self.poller.load_cookies()
+                with tracer.cycle(self.tenant, "catalog"), governor.priority(governor.BACKGROUND):
+                    try:
+                        await self.check()
+                    except httpengine.SessionExpired:
+                        # the poll loop / keep-alive logs in again and saves the jar, pick it up next time
+                        print(f"[{self.tenant.name}] Catalog scan hit CAS, retrying with fresh cookies later")
+                        await self.poller.load_cookies()
+                    except Exception as e:
+                        # a background scan, the poll loop's backoff isn't its business
+                        await utils.handle_error("Error in CatalogScanner.check", e, "", self.tenant, poll=False)
+            await asyncio.sleep(config.CATALOG_INTERVAL)
+
+    async def close(self):
+        if self.poller is not None:
+            await self.poller.close()
@@ -4,14 +4,91 @@ load_dotenv(override=True)
 
 start_time = None
 
+# Where GOLD lives and how to recognise the CAS login page (a substring of its url).
+# Overridable from the environment to point the scanner at mock_gold.py
+GOLD_URL = os.environ.get('GOLD_URL', 'https://my.sa.ucsb.edu/gold')
+CAS_LOGIN_URL = os.environ.get('CAS_LOGIN_URL', 'sso.ucsb.edu/cas/login')
+
 HEADLESS = True
 
-TARGET_CLASS_NUMBER = '42747' # 120B stats
+# Attach to the Chromium kept up by browserd.py instead of launching one, e.g. http://127.0.0.1:9222.
+# A restart then skips the cold browser launch; with nothing answering there Chromium is launched as usual.
+BROWSER_CDP_URL = os.environ.get('BROWSER_CDP_URL')
+BROWSER_DAEMON_PORT = 9222
+# browserd.py writes its pid here, so the RSS watermarks can find the Chromium it owns
+BROWSER_DAEMON_PID_FILE = 'browserd.pid'
+
+# "browser" drives every poll through Playwright, "http" replays the search
+# postback with httpx and only uses the browser to re-authenticate
+POLL_ENGINE = "browser"
+HTTP_TIMEOUT = 20
+HTTP_USER_AGENT = "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+
+# Sections to watch, keyed by (quarter, subject area, course number).
+# Only seeds WATCHLIST_PATH on the first run; after that edit that file or use the /watchlist endpoints, see watchlist.py.
+# Every watched section of a course is read off the same search result page,
+# so the number of searches per poll is the number of distinct courses.
+WATCHLIST = {
+    ("20251", "PSTAT", "120B"): ["42747"],  # 120B stats
+}
+
+# live watchlist of every tenant, checked for changes this often (seconds)
+WATCHLIST_PATH = 'watchlist.json'
+WATCHLIST_CHECK_INTERVAL = 5
+
+# Subject-wide watches of the default tenant, e.g. any open upper-division PSTAT section that
+# doesn't meet on Friday: {"quarter": "20251", "subject": "PSTAT", "min_course": 100, "max_course": 199, "days": "MTWR"}.
+# Optional filters: min_course, max_course, days (allowed meeting days), after/before ("HH:MM", 24h). See catalog.py.
+# Seeds WATCHLIST_PATH like WATCHLIST.
+CATALOG = []
+# seconds between scans of each subject, a subject page is one large postback
+CATALOG_INTERVAL = 300
+# sections kept in the in-memory catalog index, over all subjects
+CATALOG_MAX_SECTIONS = 5000
+# class of the element holding "PSTAT 120B - ..." above each course's sections on the result page
+CATALOG_COURSE_TITLE_CLASS = 'courseTitle'
 
 cookies_path = 'cookies.json'
+
+# Request trimming on the browser context, see network.py
+BLOCK_RESOURCES = True
+BLOCKED_RESOURCE_TYPES = ["image", "font", "media", "stylesheet"]
+# resource types are only blocked on these hosts, CAS and Duo load normally
+TRIMMED_HOSTS = ["my.sa.ucsb.edu"]
+# always blocked, whatever the resource type
+BLOCKED_HOSTS = ["google-analytics.com", "googletagmanager.com", "fonts.googleapis.com", "fonts.gstatic.com"]
+# waited on after the search postback instead of networkidle
+RESULTS_READY_SELECTOR = 'div[data-target]'
+
+# "failure" keeps DOM snapshots of the current cycle in memory and writes them to
+# ./screenshots only when an error is handled, "always" writes a PNG at every
+# step (debugging), "off" captures nothing
+CAPTURE_MODE = "failure"
+CAPTURE_RING_SIZE = 16
+
+# Cycle traces, see tracer.py and trace_report.py. "slow" exports failed cycles and ones over
+# TRACE_SLOW_SECONDS, "all" every cycle (for profiling), "off" none
+TRACE_EXPORT = "slow"
+TRACE_PATH = 'traces.jsonl'
+TRACE_SLOW_SECONDS = 20
+# spans + events kept per cycle
+TRACE_MAX_ITEMS = 512
+# TRACE_PATH is moved to TRACE_PATH.1 above this size
+TRACE_MAX_BYTES = 50 * 2 ** 20
+# Outgoing mail, point SMTP_HOST/SMTP_PORT at a local stand-in to test, e.g.
+# `python -m aiosmtpd -n -l localhost:1025` with SMTP_STARTTLS=0 SMTP_LOGIN=0
+SMTP_HOST = os.environ.get('SMTP_HOST', 'smtp.gmail.com')
+SMTP_PORT = int(os.environ.get('SMTP_PORT', 587))  #TLS
+SMTP_STARTTLS = os.environ.get('SMTP_STARTTLS', '1') == '1'
+SMTP_LOGIN = os.environ.get('SMTP_LOGIN', '1') == '1'
+# repeats of an error within this many seconds are mailed as one digest
+ERROR_DIGEST_WINDOW = 900
+
 #default email message
 email_message = "An error occurred while running the program. Please check the logs for more information.\n"
 
+# search form template, the quarter/subject/course fields are filled per
+# WATCHLIST course by utils.course_payload
 payload = {
     
     "ctl00$pageContent$quarterDropDown": "20251", #2025 winter
@@ -25,14 +102,109 @@ payload = {
     "__LASTFOCUS": ""
 }
 
+# Further accounts scanned from the same Chromium, each in its own BrowserContext.
+# Credentials come from .env keys with the prefix, e.g. ALICE_username,
+# ALICE_passwd, ALICE_HOPT_KEY, ALICE_HOPT_COUNTER
+TENANTS = {
+    # "alice": {
+    #     "env_prefix": "ALICE_",
+    #     "to_email": "alice@example.com",
+    #     "watchlist": {("20251", "PSTAT", "120C"): ["42770"]},
+    # },
+}
 
-auth_log = []
-cas_auth_counter = int(0)
-duo_auth_counter = int(0)
-
-payload_classname = payload["ctl00$pageContent$subjectAreaDropDown"] + \
-    " " + payload["ctl00$pageContent$courseNumberTextBox"]
-
+# entries of each tenant's auth log kept for /health and error mails
+AUTH_LOG_SIZE = 50
+
+# how many tenant pages may be in the middle of a poll at once
+MAX_CONCURRENT_PAGES = 2
+
+# Request budget shared by every tenant, shard and engine, see governor.py: navigations and postbacks
+# per minute (0 turns the governor off) and how many may go out back to back after a quiet spell
+GOVERNOR_RATE = 60
+GOVERNOR_BURST = 10
+
+# Failed polls are retried on the same page by supervisor.py, after SUPERVISOR_BACKOFF_BASE seconds doubling up
+# to SUPERVISOR_BACKOFF_MAX. Auth failures wait at least SUPERVISOR_AUTH_BACKOFF and end the tenant's run after
+# SUPERVISOR_MAX_AUTH_FAILURES in a row; SUPERVISOR_RECYCLE_AFTER unexpected pages in a row get a fresh page.
+SUPERVISOR_BACKOFF_BASE = 2
+SUPERVISOR_BACKOFF_MAX = 300
+SUPERVISOR_AUTH_BACKOFF = 120
+SUPERVISOR_MAX_AUTH_FAILURES = 3
+SUPERVISOR_RECYCLE_AFTER = 3
+# BREAKER_THRESHOLD failed polls in a row across all tenants pause every poll for BREAKER_COOLDOWN seconds,
+# doubling up to BREAKER_COOLDOWN_MAX while the probe after it keeps failing
+BREAKER_THRESHOLD = 5
+BREAKER_COOLDOWN = 60
+BREAKER_COOLDOWN_MAX = 900
+
+# Sessions per tenant polling the same watchlist in turn, each with its own cookie
+# jar (shard 0 uses cookies_path, the others cookies-shard<N>.json), see shards.py. 1 is the plain single-page loop.
+# Sharding always uses the browser engine.
+SHARDS = 1
+
+# Browser recycling, see lifecycle.py. 0 turns a limit off.
+# seconds between Chromium RSS samples
+RECYCLE_SAMPLE_INTERVAL = 60
+# a tenant gets a fresh page after this many navigations, a fresh context (cookies carried over) after this many
+RECYCLE_PAGE_NAVIGATIONS = 500
+RECYCLE_CONTEXT_NAVIGATIONS = 5000
+# largest renderer above this: fresh pages; all Chromium processes above these: fresh contexts, then a new Chromium (MB)
+RECYCLE_RENDERER_RSS_MB = 400
+RECYCLE_CONTEXT_RSS_MB = 1200
+RECYCLE_BROWSER_RSS_MB = 2000
+# a memory-triggered recycle of one level doesn't repeat within this many seconds
+RECYCLE_COOLDOWN = 600
+
+# Poll interval bounds in seconds, see scheduler.py
+POLL_MIN_INTERVAL = 2
+POLL_MAX_INTERVAL = 30
+# +- fraction of randomness on every interval
+POLL_JITTER = 0.3
+# max search postbacks per tenant per hour
+POLL_REQUEST_BUDGET = 900
+# the interval may grow to POLL_MAX_INTERVAL * this after errors/reauths
+POLL_BACKOFF_MAX = 16
+# poll at POLL_MIN_INTERVAL for this many seconds after any seat change
+CHURN_WINDOW = 600
+# how fast the learned busy hours are forgotten
+SCHEDULER_HALF_LIFE_DAYS = 7
+
+# Background session refresh, see keepalive.py (seconds)
+KEEPALIVE = True
+# refresh this long before the session is expected to end
+KEEPALIVE_MARGIN = 900
+# check at least this often
+KEEPALIVE_INTERVAL = 1800
+# and wait at least this long after a refresh before the next one
+KEEPALIVE_MIN_INTERVAL = 300
+# Duo "remember me for 10 hours"
+DUO_REMEMBER_SECONDS = 10 * 3600
+# CAS/GOLD only set session cookies, assumed lifetime of a login
+SESSION_MAX_AGE = 8 * 3600
+# cookie expiries on these domains count towards the deadline
+SESSION_COOKIE_DOMAINS = ["ucsb.edu", "duosecurity.com"]
+
+# Auto-add a watched section as soon as it has a seat, see enroll.py.
+# The selectors are for GOLD's add-by-enrollment-code form, check them against the live page before enabling.
+AUTO_ENROLL = False
+ENROLL_URL = GOLD_URL + '/StudentSchedule.aspx'
+ENROLL_CODE_INPUT = 'input[name="ctl00$pageContent$EnrollCodeTextBox"]'
+ENROLL_ADD_BUTTON = 'input[name="ctl00$pageContent$AddCourseButton"]'
+# second confirmation step, None if the add goes through on the first click
+ENROLL_CONFIRM_BUTTON = 'input[name="ctl00$pageContent$AddToScheduleButton"]'
+ENROLL_SUCCESS_SELECTOR = '#pageContent_SuccessMessageLabel'
+# reload the add form this often so it is never stale when needed (seconds)
+ENROLL_REWARM_INTERVAL = 600
+ENROLL_CHECK_INTERVAL = 30
+
+# HOTP counters live here once used, one file per tenant; HOPT_COUNTER in .env only seeds them
+HOTP_STORE_DIR = 'hotp_counters'
+
+# seat history, one row per change, see history.py
+HISTORY_PATH = 'seat_history.db'
+# how far back the history seeds the scheduler on start
+HISTORY_SEED_DAYS = 28
 
 # Sensitive Personal Information
 
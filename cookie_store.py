@@ -0,0 +1,178 @@
+# cookie_store.py
+# The cookie jars of every tenant and shard, one file each (tenant.cookies_path).
+# A jar is read from disk once per run and kept in memory; saves compare a
+# digest with what is already on disk and only write when the jar changed.
+# Writes run off the event loop as temp file + fsync + rename, and the
+# generation they replace is kept as <jar>.bak, which is loaded instead when a
+# crash or a bad edit left the jar unreadable.
+#
+# Expired cookies are dropped on load. CAS/GOLD only set session cookies, so
+# those are dropped too once the jar is older than SESSION_MAX_AGE; a jar with
+# no cookie left for GOLD's host needs a login, and session.py goes straight to it.
+#
+# The tenant's last CAS and Duo login times go into <jar>.auth next to it, so
+# after a restart keepalive.py still knows when the session and the Duo
+# "remember me" window run out.
+
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from urllib.parse import urlparse
+import config
+
+
+def sent_to_gold(cookie) -> bool:
+    host = urlparse(config.GOLD_URL).hostname
+    domain = cookie['domain'].lstrip('.')
+    return host == domain or host.endswith('.' + domain)
+
+
+def digest(cookies) -> str:
+    return hashlib.sha256(json.dumps(cookies, sort_keys=True).encode()).hexdigest()
+
+
+class CookieStore:
+
+    def __init__(self):
+        self.jars = {}  # path -> {"cookies": [...], "digest": str, "needs_auth": bool, "rotate": bool}
+        self.auth = {}  # path -> {"authed_at": float, "duo_authed_at": float} as in <path>.auth
+        self.lock = threading.Lock()
+
+    def _read(self, path):
+        """Cookies, save time and whether `path` itself was read (not its .bak). None if neither is readable."""
+        for candidate in (path, path + '.bak'):
+            try:
+                with open(candidate, 'r') as f:
+                    cookies = json.load(f)
+                saved_at = os.stat(candidate).st_mtime
+            except FileNotFoundError:
+                continue
+            except ValueError as e:
+                print(f"Cookie jar {candidate} is unreadable ({e}), trying the previous generation")
+                continue
+            if candidate != path:
+                print(f"Cookie jar {path} restored from {candidate}")
+            return cookies, saved_at, candidate == path
+        return None
+
+    def _validate(self, cookies, saved_at) -> list:
+        now = time.time()
+        session_alive = now - saved_at < config.SESSION_MAX_AGE
+        return [
+            cookie for cookie in cookies
+            if (cookie.get('expires', -1) > now) or (cookie.get('expires', -1) <= 0 and session_alive)
+        ]
+
+    def _jar(self, path) -> dict:
+        if path not in self.jars:
+            found = self._read(path)
+            if found is None:
+                self.jars[path] = {"cookies": [], "digest": None, "needs_auth": True, "rotate": True}
+            else:
+                cookies, saved_at, current = found
+                valid = self._validate(cookies, saved_at)
+                if len(valid) < len(cookies):
+                    print(f"Dropped {len(cookies) - len(valid)} expired cookies from {path}")
+                self.jars[path] = {
+                    # what is on disk, so a save of the same jar is skipped; after a restore the jar is rewritten
+                    "cookies": valid,
+                    "digest": digest(cookies) if current else None,
+                    "needs_auth": not any(sent_to_gold(cookie) for cookie in valid),
+                    # a corrupt jar must not replace the good .bak it was restored from
+                    "rotate": current,
+                }
+        return self.jars[path]
+
+    def load(self, path) -> list:
+        with self.lock:
+            return list(self._jar(path)["cookies"])
+
+    def _auth(self, path) -> dict:
+        if path not in self.auth:
+            try:
+                with open(path + '.auth', 'r') as f:
+                    self.auth[path] = json.load(f)
+            except FileNotFoundError:
+                self.auth[path] = {}
+            except ValueError as e:
+                print(f"Login times {path}.auth are unreadable ({e}), ignoring them")
+                self.auth[path] = {}
+        return self.auth[path]
+
+    def load_auth(self, path) -> dict:
+        """Login times saved with the jar, empty if there are none."""
+        with self.lock:
+            return dict(self._auth(path))
+
+    def needs_auth(self, path) -> bool:
+        """True when the jar (as read at startup, or last saved) has no live cookie for GOLD."""
+        with self.lock:
+            return self._jar(path)["needs_auth"]
+
+    def _write(self, path, cookies, rotate):
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(cookies, f)
+            f.flush()
+            os.fsync(f.fileno())
+        if rotate and os.path.exists(path):
+            # the generation we are replacing becomes the fallback
+            os.replace(path, path + '.bak')
+        os.replace(tmp, path)
+        dir_fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+    def save(self, path, cookies, auth=None) -> bool:
+        """Persist `cookies` unless the jar on disk is the same. True if it was written. `auth`: login times to keep with it."""
+        with self.lock:
+            if auth is not None and auth != self._auth(path):
+                self._write(path + '.auth', auth, rotate=False)
+                self.auth[path] = dict(auth)
+            jar = self._jar(path)
+            jar["needs_auth"] = not any(sent_to_gold(cookie) for cookie in cookies)
+            new_digest = digest(cookies)
+            if new_digest == jar["digest"]:
+                return False
+            self._write(path, cookies, jar["rotate"])
+            jar.update(cookies=list(cookies), digest=new_digest, rotate=True)
+            return True
+
+
+_store = None
+
+
+def store() -> CookieStore:
+    global _store
+    if _store is None:
+        _store = CookieStore()
+    return _store
+
+
+# tenant-level helpers, the file I/O runs off the event loop
+
+async def load(tenant) -> list:
+    cookies = await asyncio.to_thread(store().load, tenant.cookies_path)
+    auth = await asyncio.to_thread(store().load_auth, tenant.cookies_path)
+    # a restart doesn't reset the session clock
+    if tenant.authed_at is None:
+        tenant.authed_at = auth.get("authed_at")
+    if tenant.duo_authed_at is None:
+        tenant.duo_authed_at = auth.get("duo_authed_at")
+    return cookies
+
+
+async def save(tenant, cookies) -> bool:
+    auth = None
+    if tenant.authed_at is not None or tenant.duo_authed_at is not None:
+        auth = {"authed_at": tenant.authed_at, "duo_authed_at": tenant.duo_authed_at}
+    return await asyncio.to_thread(store().save, tenant.cookies_path, cookies, auth)
+
+
+def needs_auth(tenant) -> bool:
+    return store().needs_auth(tenant.cookies_path)
@@ -1,38 +1,81 @@
-
 import smtplib
 
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
+import config
 from config import email_addr as from_email, email_password as password
 
 
-def send_email(subject, body, to_email):
-
-    smtp_server = 'smtp.gmail.com'
-    smtp_port = 587  #TLS
-
-
+def build_message(subject, body, to_email):
     msg = MIMEMultipart()
     msg['From'] = from_email
     msg['To'] = to_email
     msg['Subject'] = subject
     msg.attach(MIMEText(body, 'plain'))
+    return msg
 
-    try:
-       
-        server = smtplib.SMTP(smtp_server, smtp_port)
-        server.ehlo()
-        server.starttls()
-        server.ehlo()
 
-        server.login(from_email, password)
+class SmtpSession:
+    """One logged-in SMTP connection, kept open between messages and reopened when the server drops it."""
+
+    def __init__(self, host=None, port=None):
+        self.host = host or config.SMTP_HOST
+        self.port = port or config.SMTP_PORT
+        self.server = None
+
+    def connect(self):
+        server = smtplib.SMTP(self.host, self.port, timeout=30)
+        try:
+            server.ehlo()
+            if config.SMTP_STARTTLS:
+                server.starttls()
+                server.ehlo()
+            if config.SMTP_LOGIN:
+                server.login(from_email, password)
+        except Exception:
+            server.close()
+            raise
+        self.server = server
 
-        server.send_message(msg)
+    def send(self, msg):
+        """Send on the open connection, reconnecting once if it went stale. Blocking."""
+        if self.server is None:
+            self.connect()
+        try:
+            self.server.send_message(msg)
+        except smtplib.SMTPResponseException as e:
+            if not 400 <= e.smtp_code < 500:
+                # a permanent 5xx rejection, sending it again gets the same answer
+                raise
+            self._resend(msg)
+        except (smtplib.SMTPServerDisconnected, OSError):
+            self._resend(msg)
+
+    def _resend(self, msg):
+        # idle connections get dropped (421, reset), one fresh login and retry
+        self.close()
+        self.connect()
+        self.server.send_message(msg)
+
+    def close(self):
+        if self.server is None:
+            return
+        try:
+            self.server.quit()
+        except Exception:
+            self.server.close()
+        self.server = None
+
+
+def send_email(subject, body, to_email):
+    """One-off message on its own connection, prefer notifier.get() inside the scanner."""
+    session = SmtpSession()
+    try:
+        session.send(build_message(subject, body, to_email))
         print(f"Email sent successfully to {to_email}")
 
     except Exception as e:
         print(f"An error occurred while sending the email: {e}")
 
     finally:
-        server.quit()
-
+        session.close()
@@ -0,0 +1,103 @@
+# enroll.py
+# Optional auto-add on vacancy. A second page in the tenant's context sits on
+# GOLD's add-section form, re-warmed every ENROLL_REWARM_INTERVAL, so when a
+# poll sees a seat the add is a fill + click on an already loaded page.
+# Detection-to-submit latency goes into scanner_enroll_seconds.
+
+import asyncio
+import time
+import config
+import governor
+import metrics
+import tracer
+import utils
+from session import CAS_LOGIN_URL
+
+ENROLL_SECONDS = metrics.Histogram(
+    "scanner_enroll_seconds", "Time from reading a vacancy off the result page to submitting the add",
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 5))
+ENROLL_ATTEMPTS = metrics.Counter("scanner_enroll_attempts_total", "Auto-add attempts by result")
+
+
+class AutoEnroller:
+
+    def __init__(self, context, tenant):
+        self.context = context
+        self.tenant = tenant
+        self.page = None
+        self.warmed_at = None
+        self.lock = asyncio.Lock()
+
+    def rebind(self, context):
+        """Move to a new context after lifecycle.py replaced the old one, the next check re-warms."""
+        self.context = context
+        self.page = None
+        self.warmed_at = None
+
+    @property
+    def ready(self) -> bool:
+        return self.warmed_at is not None and time.monotonic() - self.warmed_at < config.ENROLL_REWARM_INTERVAL
+
+    async def warm(self):
+        """Load the add form. Leaves the enroller cold if the session is gone, the poll loop reauthenticates."""
+        async with self.lock:
+            self.warmed_at = None
+            if self.page is None or self.page.is_closed():
+                self.page = await self.context.new_page()
+            await governor.acquire(self.tenant)
+            await self.page.goto(config.ENROLL_URL, wait_until='domcontentloaded')
+            if CAS_LOGIN_URL in self.page.url:
+                print(f"[{self.tenant.name}] Add form needs a login, waiting for the poll loop to reauthenticate")
+                return
+            await self.page.wait_for_selector(config.ENROLL_CODE_INPUT, state='visible', timeout=10000)
+            self.warmed_at = time.monotonic()
+
+    async def keep_warm(self):
+        while True:
+            if not self.ready:
+                try:
+                    with tracer.cycle(self.tenant, "enroll_warm"), governor.priority(governor.BACKGROUND):
+                        await self.warm()
+                except Exception as e:
+                    print(f"[{self.tenant.name}] Could not warm the add form: {e}")
+            await asyncio.sleep(config.ENROLL_CHECK_INTERVAL)
+
+    async def enroll(self, row, detected_at) -> bool:
+        """Submit the add for a vacant SectionRow. `detected_at` is the time.perf_counter() of the read."""
+        # ahead of every other request waiting for the budget, a cold warm() included
+        with tracer.span("enroll", section=row.section), governor.priority(governor.VACANCY):
+            return await self._enroll(row, detected_at)
+
+    async def _enroll(self, row, detected_at) -> bool:
+        """Never raises, a failed add is mailed and counted but it isn't a failed poll."""
+        tenant = self.tenant
+        try:
+            if not self.ready:
+                # a cold add is still faster than a human
+                await self.warm()
+                if not self.ready:
+                    raise Exception("Add form needs a login")
+            async with self.lock:
+                try:
+                    page = self.page
+                    await page.fill(config.ENROLL_CODE_INPUT, row.section)
+                    await governor.acquire(tenant)
+                    await page.click(config.ENROLL_ADD_BUTTON)
+                    submitted = time.perf_counter() - detected_at
+                    ENROLL_SECONDS.observe(submitted, tenant=tenant.name)
+                    print(f"[{tenant.name}] Add submitted for section {row.section} {submitted * 1000:.0f} ms after detection")
+
+                    if config.ENROLL_CONFIRM_BUTTON:
+                        await governor.acquire(tenant)
+                        await page.click(config.ENROLL_CONFIRM_BUTTON, timeout=10000)
+                    await page.wait_for_selector(config.ENROLL_SUCCESS_SELECTOR, timeout=10000)
+                    ENROLL_ATTEMPTS.inc(result="added", tenant=tenant.name)
+                    return True
+                finally:
+                    # the form is spent either way
+                    self.warmed_at = None
+
+        except Exception as e:
+            ENROLL_ATTEMPTS.inc(result="failed", tenant=tenant.name)
+            await utils.handle_error(f"Error in AutoEnroller.enroll for section {row.section}", e, "", tenant, poll=False)
+            return False
@@ -0,0 +1,173 @@
+# governor.py
+# One request budget for everything that talks to GOLD, CAS and Duo: a token
+# bucket refilled at GOVERNOR_RATE requests per minute, up to GOVERNOR_BURST.
+# Every navigation and postback awaits acquire() first, whichever tenant,
+# shard, poll engine or background task makes it.
+#
+# Waiters are served by priority class, then round-robin across accounts
+# within a class, so one tenant with many courses can't starve another:
+#
+#   VACANCY     submitting the add once a seat was seen
+#   AUTH        CAS login, Duo, keep-alive refreshes
+#   HIGH        watched sections (the default)
+#   BACKGROUND  sections marked "priority": "background" in watchlist.json,
+#               catalog scans, warming the add form
+#
+# The class follows the asyncio task like tracer.py's current span:
+#
+#   with governor.priority(governor.AUTH):
+#       await governor.acquire(tenant)
+#       await page.goto(...)
+
+import asyncio
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+import config
+import metrics
+import tracer
+
+VACANCY, AUTH, HIGH, BACKGROUND = range(4)
+NAMES = ("vacancy", "auth", "high", "background")
+
+GRANTED = metrics.Counter("scanner_governor_granted_total", "Requests let through by the governor, by priority and account")
+WAIT_SECONDS = metrics.Histogram(
+    "scanner_governor_wait_seconds", "Time requests waited for a governor token, by priority",
+    buckets=(0.01, 0.1, 0.5, 1, 2, 5, 10, 30, 60))
+TOKENS = metrics.Gauge("scanner_governor_tokens", "Requests the governor could let through right now",
+                       callback=lambda: _governor.available() if _governor is not None else None)
+
+_priority = ContextVar("governor_priority", default=HIGH)
+
+
+@contextmanager
+def priority(level):
+    """Requests made inside the block (by this task) acquire at `level`."""
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def section_priority(tenant, course) -> int:
+    return BACKGROUND if course in tenant.background_courses else HIGH
+
+
+class Governor:
+
+    def __init__(self, rate_per_minute, burst):
+        self.rate = rate_per_minute / 60
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        # per priority: account -> deque of futures, in round-robin order
+        self.queues = [OrderedDict() for _ in NAMES]
+        self.dispatcher = None
+        # (monotonic time, priority, account) of the grants of the last minute, for /governor
+        self.recent = deque()
+
+    def available(self) -> float:
+        """Tokens right now, without touching the bucket (safe from the health server thread)."""
+        return min(self.burst, self.tokens + (time.monotonic() - self.updated) * self.rate)
+
+    def _refill(self):
+        self.tokens = self.available()
+        self.updated = time.monotonic()
+
+    def _waiting(self) -> bool:
+        return any(self.queues)
+
+    def _grant(self, level, account):
+        self.tokens -= 1
+        now = time.monotonic()
+        self.recent.append((now, level, account))
+        while self.recent and self.recent[0][0] < now - 60:
+            self.recent.popleft()
+        GRANTED.inc(priority=NAMES[level], account=account)
+
+    async def acquire(self, tenant, level=None):
+        """Wait for a token. `level` defaults to the class set with priority()."""
+        if self.rate <= 0:
+            return
+        level = _priority.get() if level is None else level
+        account = tenant.identity if tenant is not None else ""
+        self._refill()
+        if not self._waiting() and self.tokens >= 1:
+            self._grant(level, account)
+            WAIT_SECONDS.observe(0, priority=NAMES[level])
+            return
+
+        waiter = asyncio.get_running_loop().create_future()
+        self.queues[level].setdefault(account, deque()).append(waiter)
+        if self.dispatcher is None or self.dispatcher.done():
+            self.dispatcher = asyncio.create_task(self._dispatch())
+        started = time.perf_counter()
+        with tracer.span("governor_wait", priority=NAMES[level]):
+            await waiter
+        WAIT_SECONDS.observe(time.perf_counter() - started, priority=NAMES[level])
+
+    def _next(self):
+        """Pop the next waiter: highest class first, accounts in turn within it. Skips cancelled waiters."""
+        for level, queue in enumerate(self.queues):
+            while queue:
+                account, waiters = next(iter(queue.items()))
+                waiter = waiters.popleft()
+                if waiters:
+                    # back of the line for this account's next request
+                    queue.move_to_end(account)
+                else:
+                    del queue[account]
+                if not waiter.done():
+                    return level, account, waiter
+        return None
+
+    async def _dispatch(self):
+        while self._waiting():
+            self._refill()
+            if self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                continue
+            found = self._next()
+            if found is None:
+                break
+            level, account, waiter = found
+            self._grant(level, account)
+            waiter.set_result(None)
+
+    def snapshot(self) -> dict:
+        """Budget use for /governor. Read from the health server thread, so only copies are iterated."""
+        cutoff = time.monotonic() - 60
+        recent = [(level, account) for at, level, account in list(self.recent) if at >= cutoff]
+        return {
+            "rate_per_minute": self.rate * 60,
+            "burst": self.burst,
+            "tokens": round(self.available(), 2),
+            "last_minute": {
+                NAMES[level]: sum(1 for granted, _ in recent if granted == level) for level in range(len(NAMES))
+            },
+            "last_minute_by_account": {
+                account: sum(1 for _, granted in recent if granted == account)
+                for account in {account for _, account in recent}
+            },
+            "waiting": {
+                NAMES[level]: {account: len(waiters) for account, waiters in list(queue.items())}
+                for level, queue in enumerate(self.queues)
+            },
+        }
+
+
+_governor = None
+
+
+def get() -> Governor:
+    """The process-wide governor, shared by every tenant and engine."""
+    global _governor
+    if _governor is None:
+        _governor = Governor(config.GOVERNOR_RATE, config.GOVERNOR_BURST)
+    return _governor
+
+
+async def acquire(tenant, level=None):
+    await get().acquire(tenant, level)
@@ -1,7 +1,16 @@
 # health_server.py
 
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse
+from pydantic import BaseModel
+import catalog
 import config
+import governor
+import metrics
+import shards
+import supervisor
+import tenants
+import watchlist
 #want uptime
 from datetime import datetime
 
@@ -10,10 +19,124 @@ app = FastAPI()
 @app.get("/health")
 async def health_check():
     uptime = datetime.now() - config.start_time
+    # never create a tenant from this thread, it would open the history store here
+    default = tenants.registry.get("default")
     return {
         "status": "UP",
         "uptime": str(uptime),
-        "auth_log": config.auth_log, 
-        "duo_auth_counter": config.duo_auth_counter,  
-        "cas_auth_counter": config.cas_auth_counter  
+        "auth_log": list(default.auth_log) if default else [],
+        "duo_auth_counter": default.duo_auth_counter if default else 0,
+        "cas_auth_counter": default.cas_auth_counter if default else 0,
+        "breaker": supervisor.breaker().health(),
+        "tenants": {
+            name: {
+                "auth_log": list(tenant.auth_log),
+                "duo_auth_counter": tenant.duo_auth_counter,
+                "cas_auth_counter": tenant.cas_auth_counter,
+            }
+            for name, tenant in tenants.registry.items() if name != "default"
+        }
     }
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/governor")
+async def governor_state():
+    """Request budget: tokens left, grants of the last minute by priority and account, who is waiting."""
+    return governor.get().snapshot()
+
+
+@app.get("/shards")
+async def shard_health():
+    return {name: shard_set.health() for name, shard_set in shards.registry.items()}
+
+
+# Watchlist control, see watchlist.py. Changes are written to WATCHLIST_PATH and
+# picked up by each tenant's next poll; the browser sessions are left alone.
+
+class SectionIn(BaseModel):
+    quarter: str
+    subject: str
+    course: str
+    section: str
+
+
+def _tenant_entry(data, tenant):
+    if tenant not in tenants.registry:
+        raise HTTPException(status_code=404, detail=f"No tenant {tenant!r}")
+    return data.setdefault(tenant, {"courses": [], "paused": [], "catalog": []})
+
+
+def _find_section(entry, section):
+    for course in entry["courses"]:
+        if section in course["sections"]:
+            return course
+    raise HTTPException(status_code=404, detail=f"Section {section} is not watched")
+
+
+@app.get("/watchlist")
+def get_watchlist():
+    return watchlist.read()
+
+
+@app.post("/watchlist/{tenant}/sections")
+def add_section(tenant: str, section: SectionIn):
+    def change(data):
+        entry = _tenant_entry(data, tenant)
+        key = watchlist.course_key(section.model_dump())
+        for course in entry["courses"]:
+            if watchlist.course_key(course) == key:
+                if section.section not in course["sections"]:
+                    course["sections"].append(section.section)
+                return
+        entry["courses"].append({"quarter": key[0], "subject": key[1], "course": key[2], "sections": [section.section]})
+    return watchlist.edit(change)[tenant]
+
+
+@app.delete("/watchlist/{tenant}/sections/{section}")
+def remove_section(tenant: str, section: str):
+    def change(data):
+        entry = _tenant_entry(data, tenant)
+        course = _find_section(entry, section)
+        course["sections"].remove(section)
+        if not course["sections"]:
+            entry["courses"].remove(course)
+        if section in entry["paused"]:
+            entry["paused"].remove(section)
+    return watchlist.edit(change)[tenant]
+
+
+@app.post("/watchlist/{tenant}/sections/{section}/pause")
+def pause_section(tenant: str, section: str):
+    def change(data):
+        entry = _tenant_entry(data, tenant)
+        _find_section(entry, section)
+        if section not in entry["paused"]:
+            entry["paused"].append(section)
+    return watchlist.edit(change)[tenant]
+
+
+@app.post("/watchlist/{tenant}/sections/{section}/resume")
+def resume_section(tenant: str, section: str):
+    def change(data):
+        entry = _tenant_entry(data, tenant)
+        if section in entry["paused"]:
+            entry["paused"].remove(section)
+    return watchlist.edit(change)[tenant]
+
+
+@app.get("/catalog")
+def query_catalog(quarter: str = None, subject: str = None, min_course: int = None, max_course: int = None,
+                  open_only: bool = False, days: str = None, after: str = None, before: str = None):
+    """Sections of the last subject-wide scans, filtered like a catalog query in watchlist.json."""
+    entries = catalog.index().query(quarter, subject, min_course, max_course, open_only, days, after, before)
+    return [
+        {"quarter": entry.quarter, "subject": entry.subject, "course": entry.course, "section": entry.row.section,
+         "space": entry.row.space, "max_seats": entry.row.max_seats, "days": entry.row.days, "time": entry.row.time,
+         "instructor": entry.row.instructor}
+        for entry in entries
+    ]
@@ -0,0 +1,123 @@
+# history.py
+# Append-only seat history in SQLite (WAL). A row is only written when a
+# section's space/max differs from the last stored value, so a quarter of
+# polling stays in the kilobytes. Also remembers a hash of each result page so
+# polls that saw exactly the same rows can skip the rest of the processing.
+
+import hashlib
+import sqlite3
+import time
+import config
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS seats (
+    section TEXT NOT NULL,
+    ts INTEGER NOT NULL,
+    space INTEGER,
+    max_seats INTEGER,
+    PRIMARY KEY (section, ts)
+) WITHOUT ROWID
+"""
+
+FULL = 0
+UNKNOWN = -1
+
+
+def encode_count(text):
+    """'Full' -> 0, '12' -> 12, anything else (Closed, Cancel, missing) -> -1."""
+    if text is None:
+        return UNKNOWN
+    if "Full" in text:
+        return FULL
+    text = text.strip()
+    return int(text) if text.isdigit() else UNKNOWN
+
+
+class SeatHistory:
+
+    def __init__(self, path=None):
+        self.db = sqlite3.connect(path or config.HISTORY_PATH, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        # WAL + NORMAL only fsyncs on checkpoints, a crash loses at most the last few changes
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(SCHEMA)
+
+        # section -> (space, max) of its latest row, so unchanged polls never hit the db
+        self.last = {}
+        for section, space, max_seats in self.db.execute(
+                "SELECT section, space, max_seats FROM seats s WHERE ts = "
+                "(SELECT MAX(ts) FROM seats WHERE section = s.section)"):
+            self.last[section] = (space, max_seats)
+        self.page_hashes = {}
+
+    def page_changed(self, key, rows):
+        """Digest of the result rows for `key`, None if they are exactly what the last processed poll saw."""
+        digest = hashlib.blake2b(repr(rows).encode(), digest_size=16).digest()
+        if self.page_hashes.get(key) == digest:
+            return None
+        return digest
+
+    def page_processed(self, key, digest):
+        """Remember a page_changed() digest once its rows went through, a failed poll reprocesses them."""
+        self.page_hashes[key] = digest
+
+    def forget_pages(self, tenant_name):
+        """Drop the digests of a tenant and its shards, their next polls look at every page again."""
+        # called from the health server thread too, so no iterating the dict itself
+        for key in list(self.page_hashes):
+            if key[0].split('#')[0] == tenant_name:
+                self.page_hashes.pop(key, None)
+
+    def record(self, rows, when=None) -> list:
+        """Store the SectionRows whose values changed, returns [(row, previous (space, max) or None)]."""
+        ts = int(when if when is not None else time.time())
+        changed = []
+        for row in rows:
+            value = (encode_count(row.space), encode_count(row.max_seats))
+            previous = self.last.get(row.section)
+            if previous == value:
+                continue
+            self.last[row.section] = value
+            changed.append((row, previous))
+
+        if changed:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO seats (section, ts, space, max_seats) VALUES (?, ?, ?, ?)",
+                [(row.section, ts, *self.last[row.section]) for row, _ in changed])
+        return changed
+
+    # Query API
+
+    def latest(self, section):
+        """(space, max) last stored for a section, or None."""
+        return self.last.get(section)
+
+    def changes(self, section, since=None, until=None) -> list:
+        """[(ts, space, max)] of one section, oldest first."""
+        return self.db.execute(
+            "SELECT ts, space, max_seats FROM seats WHERE section = ? AND ts >= ? AND ts <= ? ORDER BY ts",
+            (section, since or 0, until or 2**62)).fetchall()
+
+    def change_times(self, since=None) -> list:
+        """Timestamps of every stored change (first sightings excluded) since `since`."""
+        return [ts for (ts,) in self.db.execute(
+            "SELECT ts FROM seats s WHERE ts >= ? AND EXISTS "
+            "(SELECT 1 FROM seats WHERE section = s.section AND ts < s.ts) ORDER BY ts",
+            (since or 0,))]
+
+    def sections(self) -> list:
+        return sorted(self.last)
+
+    def close(self):
+        self.db.close()
+
+
+_store = None
+
+
+def store() -> SeatHistory:
+    """The process-wide history, opened on first use."""
+    global _store
+    if _store is None:
+        _store = SeatHistory()
+    return _store
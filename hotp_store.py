@@ -0,0 +1,99 @@
+# hotp_store.py
+# HOTP counters, one small file per identity, replacing the .env rewrite.
+# A counter is reserved (and persisted as used) before its code is generated,
+# committed once the code went to Duo and rolled back only if it never left.
+# So a crash can skip a counter, which Duo's look-ahead window tolerates, but
+# never reuse one. Every write is temp file + fsync + rename.
+
+import asyncio
+import json
+import os
+import threading
+import config
+
+
+class HotpCounterStore:
+
+    def __init__(self, directory=None):
+        self.directory = directory or config.HOTP_STORE_DIR
+        os.makedirs(self.directory, exist_ok=True)
+        self.states = {}  # identity -> {"next": n, "reserved": n or None}
+        self.lock = threading.Lock()
+
+    def _path(self, identity):
+        return os.path.join(self.directory, f"{identity}.json")
+
+    def _state(self, identity, seed):
+        if identity not in self.states:
+            try:
+                with open(self._path(identity), 'r') as f:
+                    self.states[identity] = json.load(f)
+            except FileNotFoundError:
+                # first run for this identity, start from the counter in .env
+                self.states[identity] = {"next": seed, "reserved": None}
+        return self.states[identity]
+
+    def _write(self, identity, state):
+        path = self._path(identity)
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+        # make the rename itself durable
+        dir_fd = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+        self.states[identity] = state
+
+    def reserve(self, identity, seed) -> int:
+        """Take the next counter. A reservation left over from a crash is skipped, not reused."""
+        with self.lock:
+            counter = self._state(identity, seed)["next"]
+            self._write(identity, {"next": counter + 1, "reserved": counter})
+            return counter
+
+    def commit(self, identity, counter):
+        """The code for `counter` was submitted to Duo."""
+        with self.lock:
+            state = self._state(identity, counter)
+            if state["reserved"] == counter:
+                self._write(identity, {"next": state["next"], "reserved": None})
+
+    def rollback(self, identity, counter):
+        """The code for `counter` never left us, hand the counter out again."""
+        with self.lock:
+            state = self._state(identity, counter)
+            if state["reserved"] == counter and state["next"] == counter + 1:
+                self._write(identity, {"next": counter, "reserved": None})
+
+    def peek(self, identity, seed) -> int:
+        with self.lock:
+            return self._state(identity, seed)["next"]
+
+
+_store = None
+
+
+def store() -> HotpCounterStore:
+    global _store
+    if _store is None:
+        _store = HotpCounterStore()
+    return _store
+
+
+# tenant-level helpers for the auth flow, the file I/O runs off the event loop
+
+async def reserve(tenant) -> int:
+    return await asyncio.to_thread(store().reserve, tenant.identity, tenant.hopt_counter)
+
+
+async def commit(tenant, counter):
+    await asyncio.to_thread(store().commit, tenant.identity, counter)
+
+
+async def rollback(tenant, counter):
+    await asyncio.to_thread(store().rollback, tenant.identity, counter)
@@ -0,0 +1,127 @@
+# httpengine.py
+# Browserless polling: replays the BasicFindCourses.aspx search postback over
+# plain HTTP with the cookies the browser saved. Playwright is only needed to
+# get those cookies again once CAS/Duo sends us back to sso.ucsb.edu.
+
+import httpx
+import capture
+import cookie_store
+import config
+import governor
+import metrics
+import supervisor
+import tracer
+import utils
+from results_parser import StreamingResultsParser, parse_rows, parse_hidden_fields
+
+SEARCH_URL = config.GOLD_URL + '/BasicFindCourses.aspx'
+
+
+class SessionExpired(Exception):
+    """GOLD redirected to the CAS login page, the browser has to re-authenticate."""
+
+
+class HttpPoller:
+
+    def __init__(self, tenant):
+        self.tenant = tenant
+        # hidden ASP.NET fields of the search form, reused until a postback is rejected
+        self.form_fields = None
+        self.client = httpx.AsyncClient(
+            headers={'User-Agent': config.HTTP_USER_AGENT},
+            timeout=config.HTTP_TIMEOUT,
+            follow_redirects=True,
+            limits=httpx.Limits(max_connections=4, max_keepalive_connections=4),
+        )
+
+    async def load_cookies(self):
+        """(Re)load the cookie jar last saved by utils.save_cookies."""
+        self.client.cookies.clear()
+        for cookie in await cookie_store.load(self.tenant):
+            self.client.cookies.set(cookie['name'], cookie['value'], domain=cookie['domain'], path=cookie.get('path', '/'))
+        # viewstate belongs to the old session
+        self.form_fields = None
+
+    async def close(self):
+        await self.client.aclose()
+
+    def _check_session(self, response):
+        if config.CAS_LOGIN_URL in str(response.url):
+            raise SessionExpired(f"Redirected to CAS: {response.url}")
+
+    async def _fetch_form(self):
+        await governor.acquire(self.tenant)
+        with metrics.stage("navigate"):
+            response = await self.client.get(SEARCH_URL)
+        self._check_session(response)
+        response.raise_for_status()
+        self.form_fields = parse_hidden_fields(response.text)
+        if '__VIEWSTATE' not in self.form_fields:
+            raise Exception("Search form has no __VIEWSTATE, unexpected page: " + str(response.url))
+
+    async def _search(self, course):
+        """Post the search for one course and return the parsed result rows."""
+        for _ in range(2):
+            if self.form_fields is None:
+                await self._fetch_form()
+            await governor.acquire(self.tenant)
+            with metrics.stage("search_postback"):
+                response = await self.client.post(SEARCH_URL, data={**self.form_fields, **utils.course_payload(course)})
+            self._check_session(response)
+            if not response.is_error:
+                with metrics.stage("parse"):
+                    rows = parse_rows(response.text)
+                if rows:
+                    return rows
+            # a stale __VIEWSTATE/__EVENTVALIDATION gets an error page or the bare form back,
+            # fetch a fresh form and try once more
+            self.form_fields = None
+        raise Exception(f"Search for {utils.course_name(course)} returned no result rows.")
+
+    async def scan(self, quarter, subject, on_row) -> int:
+        """Search a whole subject area and stream the result page through `on_row(course_title, SectionRow)`.
+
+        Returns the number of rows. The page is parsed while it downloads and never held in full.
+        """
+        payload = utils.course_payload((quarter, subject, ""))
+        for _ in range(2):
+            if self.form_fields is None:
+                await self._fetch_form()
+            parser = StreamingResultsParser(on_row, config.CATALOG_COURSE_TITLE_CLASS)
+            await governor.acquire(self.tenant)
+            with metrics.stage("catalog_scan"):
+                async with self.client.stream("POST", SEARCH_URL, data={**self.form_fields, **payload}) as response:
+                    self._check_session(response)
+                    if not response.is_error:
+                        async for chunk in response.aiter_text():
+                            parser.feed(chunk)
+                        parser.close()
+            if parser.count:
+                return parser.count
+            # same stale-form retry as _search
+            self.form_fields = None
+        raise Exception(f"Subject search for {subject} {quarter} returned no result rows.")
+
+    async def poll(self) -> str:
+        """One poll cycle over the tenant's watchlist, same contract as utils.check_class_status.
+
+        Raises SessionExpired so the caller can re-authenticate with the browser.
+        """
+        capture.new_cycle(self.tenant)
+        with tracer.cycle(self.tenant, "poll_http"):
+            try:
+                for course, sections in self.tenant.watchlist.items():
+                    with tracer.span("course", course=utils.course_name(course), engine="http"), \
+                            governor.priority(governor.section_priority(self.tenant, course)):
+                        rows = await self._search(course)
+                        tracer.event(f"Parsed {len(rows)} result rows")
+                        outcome = await utils.process_statuses(course, sections, rows, self.tenant)
+                        if outcome != supervisor.OK:
+                            return outcome
+            except SessionExpired:
+                raise
+            except Exception as e:
+                await utils.handle_error("Error in HttpPoller.poll", e, "", self.tenant)
+                return supervisor.FAILED
+
+        return supervisor.OK
@@ -0,0 +1,117 @@
+# keepalive.py
+# Re-authenticates before the session runs out instead of after a poll lands
+# on sso.ucsb.edu. The refresh runs in a throwaway BrowserContext seeded with
+# the polling context's cookies; the fresh jar is then added to the polling
+# context in one add_cookies call, so the poll loop never waits on CAS/Duo.
+
+import asyncio
+import time
+import config
+import governor
+import metrics
+import tracer
+import utils
+from session import SEARCH_URL, CAS_LOGIN_URL, QUARTER_SELECT
+
+
+class SessionKeeper:
+
+    def __init__(self, browser, context, tenant):
+        self.browser = browser
+        self.context = context
+        self.tenant = tenant
+        # called after fresh cookies were swapped in, e.g. HttpPoller.load_cookies
+        self.on_refresh = None
+
+    def rebind(self, browser, context):
+        """Follow the polling context when lifecycle.py replaces it."""
+        self.browser = browser
+        self.context = context
+
+    def deadline(self, cookies):
+        """Unix time the session is expected to end: first cookie expiry, Duo remember window, session age."""
+        deadlines = [
+            cookie['expires'] for cookie in cookies
+            if cookie.get('expires', -1) > 0
+            and any(cookie['domain'].lstrip('.').endswith(domain) for domain in config.SESSION_COOKIE_DOMAINS)
+        ]
+        if self.tenant.duo_authed_at is not None:
+            deadlines.append(self.tenant.duo_authed_at + config.DUO_REMEMBER_SECONDS)
+        if self.tenant.authed_at is not None:
+            # CAS/GOLD use session cookies, their server-side lifetime is not in the jar
+            deadlines.append(self.tenant.authed_at + config.SESSION_MAX_AGE)
+        return min(deadlines) if deadlines else None
+
+    async def run(self):
+        while True:
+            deadline = self.deadline(await self.context.cookies())
+            wait = config.KEEPALIVE_INTERVAL
+            if deadline is not None:
+                wait = min(wait, deadline - config.KEEPALIVE_MARGIN - time.time())
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+
+            if not await self.refresh():
+                # don't spin on a broken auth, the poll loop falls back to inline reauth
+                await asyncio.sleep(config.KEEPALIVE_INTERVAL)
+                continue
+
+            moved = self.deadline(await self.context.cookies())
+            if deadline is not None and (moved is None or moved <= deadline):
+                # a cookie the login doesn't reissue, refreshing again right away won't help
+                print(f"[{self.tenant.name}] Refresh didn't extend the session, next try in {config.KEEPALIVE_INTERVAL} s")
+                await asyncio.sleep(config.KEEPALIVE_INTERVAL)
+            else:
+                await asyncio.sleep(config.KEEPALIVE_MIN_INTERVAL)
+
+    def _duo_expiring(self) -> bool:
+        # unknown (a jar from before login times were kept): keep the cookies, Duo asks again if they're stale
+        return self.tenant.duo_authed_at is not None and \
+            time.time() > self.tenant.duo_authed_at + config.DUO_REMEMBER_SECONDS - config.KEEPALIVE_MARGIN
+
+    async def refresh(self) -> bool:
+        """Log in from scratch in a background context and swap its cookies into the polling context."""
+        # the whole refresh is auth traffic for the governor
+        with tracer.cycle(self.tenant, "refresh"), governor.priority(governor.AUTH), utils.background():
+            return await self._refresh()
+
+    async def _refresh(self) -> bool:
+        tenant = self.tenant
+        print(f"[{tenant.name}] Refreshing session in the background")
+        background = await self.browser.new_context()
+        try:
+            # a fresh CAS login; the Duo "remember" cookies are carried over unless that window is ending too
+            if not self._duo_expiring():
+                await background.add_cookies([
+                    cookie for cookie in await self.context.cookies()
+                    if cookie['domain'].lstrip('.').endswith('duosecurity.com')
+                ])
+            page = await background.new_page()
+
+            async with tenant.auth_lock:
+                with tracer.span("auth"):
+                    if not await utils.login_cas(page, background, tenant):
+                        return False
+            tenant.authed_at = time.time()
+
+            await governor.acquire(tenant)
+            with metrics.stage("navigate"):
+                await page.goto(SEARCH_URL, wait_until='domcontentloaded')
+            if CAS_LOGIN_URL in page.url or not await page.query_selector(QUARTER_SELECT):
+                raise Exception(f"Background session did not reach the search form: {page.url}")
+
+            # one call, the poll loop sees either the old or the new jar
+            await self.context.add_cookies(await background.cookies())
+            if not await utils.save_cookies(self.context, tenant):
+                return False
+            if self.on_refresh is not None:
+                await self.on_refresh()
+            print(f"[{tenant.name}] Session refreshed")
+            return True
+
+        except Exception as e:
+            await utils.handle_error("Error in SessionKeeper.refresh", e, "", tenant, poll=False)
+            return False
+        finally:
+            await background.close()
@@ -0,0 +1,220 @@
+# lifecycle.py
+# Keeps week-long runs inside their memory. Chromium's renderer grows with
+# every navigation, so each tenant's page and context are replaced after a
+# number of navigations or when sampled RSS crosses a watermark, and the whole
+# browser is relaunched above the last one. The cookie jar goes through
+# utils.save_cookies/load_cookies on the way, so a recycle never costs a
+# CAS/Duo login.
+# The browser is either launched here or, with BROWSER_CDP_URL, attached from
+# browserd.py so restarts don't pay for a cold Chromium.
+
+import asyncio
+import os
+import time
+import config
+import metrics
+import network
+import utils
+
+RECYCLES = metrics.Counter("scanner_recycles_total", "Pages, contexts and browsers replaced, by level and reason")
+
+MB = 2 ** 20
+
+
+class Slot:
+    """The BrowserContext and page one tenant (or shard) polls with. Re-read .context/.page after maintain()."""
+
+    def __init__(self, tenant):
+        self.tenant = tenant
+        self.browser = None
+        self.context = None
+        self.page = None
+        self.net_stats = None
+        # Lifecycle.generation of the browser the context lives in
+        self.generation = None
+        self.page_navigations = 0
+        self.context_navigations = 0
+        # "page" or "context", set by a memory sample and done on the next maintain()
+        self.pending = None
+        # called with the slot after every new context, e.g. to point a SessionKeeper at it
+        self.on_open = []
+
+    async def open(self, browser, generation):
+        self.browser = browser
+        self.context = await browser.new_context()
+        self.net_stats = await network.install(self.context)
+        await self.context.add_cookies(config.initial_cookies)
+        if not await utils.load_cookies(self.context, self.tenant):
+            raise Exception(f"Could not load cookies for {self.tenant.name}.")
+        self.generation = generation
+        self.context_navigations = 0
+        await self._new_page()
+        for callback in self.on_open:
+            callback(self)
+
+    async def _new_page(self):
+        self.page = await self.context.new_page()
+        self.page_navigations = 0
+        self.page.on("framenavigated", self._navigated)
+
+    def _navigated(self, frame):
+        if frame.parent_frame is None:
+            self.page_navigations += 1
+            self.context_navigations += 1
+
+    async def recycle_page(self):
+        old = self.page
+        await self._new_page()
+        await old.close()
+
+    async def recycle_context(self, browser, generation):
+        await self.close()
+        await self.open(browser, generation)
+
+    async def close(self):
+        if self.context is None:
+            return
+        await utils.save_cookies(self.context, self.tenant)
+        await self.context.close()
+        self.context = self.page = None
+
+
+class Lifecycle:
+    """Owns the shared Chromium and every Slot opened in it."""
+
+    def __init__(self, playwright, page_slots):
+        self.playwright = playwright
+        # a relaunch takes every permit, so it never pulls the browser out from under a poll
+        self.page_slots = page_slots
+        self.browser = None
+        # connected to browserd.py's Chromium, which a relaunch here can't restart
+        self.attached = False
+        self.generation = 0
+        self.slots = []
+        self.lock = asyncio.Lock()
+        self.sampled_at = 0
+        self.recycled_at = {"page": 0, "context": 0, "browser": 0}
+
+    async def launch(self):
+        """Attach to browserd.py's Chromium when BROWSER_CDP_URL is set and answering, launch one otherwise."""
+        self.browser = None
+        self.attached = False
+        if config.BROWSER_CDP_URL:
+            try:
+                self.browser = await self.playwright.chromium.connect_over_cdp(config.BROWSER_CDP_URL)
+                self.attached = True
+                print(f"Attached to Chromium at {config.BROWSER_CDP_URL}")
+                if os.path.exists(config.BROWSER_DAEMON_PID_FILE):
+                    with open(config.BROWSER_DAEMON_PID_FILE, 'r') as f:
+                        metrics.browser_root_pid = int(f.read())
+            except Exception as e:
+                print(f"No browser at {config.BROWSER_CDP_URL} ({e}), launching one")
+        if self.browser is None:
+            self.browser = await self.playwright.chromium.launch(headless=config.HEADLESS)
+            metrics.browser_root_pid = os.getpid()
+        self.generation += 1
+        metrics.mark_startup("browser")
+        return self.browser
+
+    async def open(self, tenant) -> Slot:
+        slot = Slot(tenant)
+        await slot.open(self.browser, self.generation)
+        self.slots.append(slot)
+        return slot
+
+    async def release(self, slot):
+        self.slots.remove(slot)
+        if slot.generation == self.generation:
+            await slot.close()
+
+    async def close(self):
+        if self.browser is not None:
+            await self.browser.close()
+
+    def _due(self, level, now) -> bool:
+        return now - self.recycled_at[level] >= config.RECYCLE_COOLDOWN
+
+    def _sample(self):
+        """Read Chromium's RSS every RECYCLE_SAMPLE_INTERVAL. Returns "browser" when it has to be relaunched."""
+        now = time.monotonic()
+        if now - self.sampled_at < config.RECYCLE_SAMPLE_INTERVAL:
+            return None
+        self.sampled_at = now
+        total = metrics.browser_rss_bytes()
+        if total is None:
+            return None
+
+        if config.RECYCLE_BROWSER_RSS_MB and total > config.RECYCLE_BROWSER_RSS_MB * MB and self._due("browser", now) \
+                and not self.attached:
+            self.recycled_at["browser"] = now
+            print(f"Chromium at {total // MB} MB, relaunching")
+            return "browser"
+        # attached to browserd.py a relaunch would only reconnect to the same Chromium, contexts are what we can free
+        context_mb = config.RECYCLE_CONTEXT_RSS_MB or (config.RECYCLE_BROWSER_RSS_MB if self.attached else 0)
+        if context_mb and total > context_mb * MB and self._due("context", now):
+            self.recycled_at["context"] = now
+            print(f"Chromium at {total // MB} MB, recycling every context")
+            for slot in self.slots:
+                slot.pending = "context"
+            return None
+
+        renderer = metrics.renderer_rss_bytes() or 0
+        if config.RECYCLE_RENDERER_RSS_MB and renderer > config.RECYCLE_RENDERER_RSS_MB * MB and self._due("page", now):
+            self.recycled_at["page"] = now
+            print(f"Largest renderer at {renderer // MB} MB, recycling every page")
+            for slot in self.slots:
+                slot.pending = slot.pending or "page"
+        return None
+
+    async def relaunch(self):
+        generation = self.generation
+        async with self.lock:
+            if self.generation != generation:
+                # someone else just did it
+                return
+            for _ in range(config.MAX_CONCURRENT_PAGES):
+                await self.page_slots.acquire()
+            try:
+                for slot in self.slots:
+                    if slot.generation == generation:
+                        await utils.save_cookies(slot.context, slot.tenant)
+                await self.browser.close()
+                await self.launch()
+                RECYCLES.inc(level="browser", reason="rss")
+            finally:
+                for _ in range(config.MAX_CONCURRENT_PAGES):
+                    self.page_slots.release()
+
+    async def maintain(self, slot):
+        """Call before each poll, outside page_slots. Replaces what is due in this slot."""
+        if self._sample() == "browser":
+            await self.relaunch()
+
+        if slot.generation != self.generation:
+            # its context went down with the old browser, the jar was saved before
+            await slot.open(self.browser, self.generation)
+            slot.pending = None
+            return
+
+        if slot.pending == "context":
+            reason = "rss"
+        elif config.RECYCLE_CONTEXT_NAVIGATIONS and slot.context_navigations >= config.RECYCLE_CONTEXT_NAVIGATIONS:
+            reason = "navigations"
+        else:
+            reason = None
+        if reason:
+            print(f"[{slot.tenant.name}] Recycling context ({reason})")
+            await slot.recycle_context(self.browser, self.generation)
+            slot.pending = None
+            RECYCLES.inc(level="context", reason=reason)
+            return
+
+        if slot.pending == "page":
+            reason = "rss"
+        elif config.RECYCLE_PAGE_NAVIGATIONS and slot.page_navigations >= config.RECYCLE_PAGE_NAVIGATIONS:
+            reason = "navigations"
+        if reason:
+            print(f"[{slot.tenant.name}] Recycling page ({reason})")
+            await slot.recycle_page()
+            slot.pending = None
+            RECYCLES.inc(level="page", reason=reason)
@@ -1,41 +1,152 @@
+import metrics  # first, startup times are measured from its import
 import utils
+import enroll
+import catalog
+import history
+import keepalive
+import shards
+import supervisor
+import tenants
+import watchlist
 import threading
+from lifecycle import Lifecycle
 from playwright.async_api import async_playwright
-from random import randint
 
+metrics.mark_startup("imports")
 utils.load_dotenv(override=True)
 
+async def run_tenant(lifecycle, tenant, page_slots):
+    """Poll one tenant's watchlist in its own BrowserContext until it concludes, scanning its catalog queries alongside."""
+    # subject-wide searches over HTTP with the cookies the poll loop keeps fresh, see catalog.py
+    scanner = catalog.CatalogScanner(tenant)
+    scanner_task = utils.asyncio.create_task(scanner.run())
+    try:
+        if utils.config.SHARDS > 1:
+            # several sessions on phase-offset ticks instead of the single loop below
+            return await shards.ShardSet(lifecycle, tenant, page_slots).run()
+        return await poll_tenant(lifecycle, tenant, page_slots)
+    finally:
+        scanner_task.cancel()
+        await scanner.close()
+
+async def poll_tenant(lifecycle, tenant, page_slots):
+
+    # context and page (with the cookies from the last session), replaced from time to time by lifecycle.py
+    slot = await lifecycle.open(tenant)
+
+    poller = None
+    if utils.config.POLL_ENGINE == "http":
+        import httpengine
+        poller = httpengine.HttpPoller(tenant)
+        await poller.load_cookies()
+
+    keeper_task = None
+    if utils.config.KEEPALIVE:
+        # refreshes the session in the background before it runs out
+        keeper = keepalive.SessionKeeper(lifecycle.browser, slot.context, tenant)
+        slot.on_open.append(lambda opened: keeper.rebind(opened.browser, opened.context))
+        if poller is not None:
+            keeper.on_refresh = poller.load_cookies
+        keeper_task = utils.asyncio.create_task(keeper.run())
+
+    enroll_task = None
+    if utils.config.AUTO_ENROLL:
+        # second page kept on the add form, used the moment a poll sees a seat
+        tenant.enroller = enroll.AutoEnroller(slot.context, tenant)
+        slot.on_open.append(lambda opened: tenant.enroller.rebind(opened.context))
+        enroll_task = utils.asyncio.create_task(tenant.enroller.keep_warm())
+
+    async def attempt():
+        await lifecycle.maintain(slot)
+        page, context = slot.page, slot.context
+
+        # only a bounded number of tenants drive their page at the same time
+        async with page_slots:
+            if poller is None:
+                status = await utils.check_class_status(page, context, tenant)
+            else:
+                try:
+                    status = await poller.poll()
+                except httpengine.SessionExpired:
+                    # let the browser go through CAS/Duo, this also counts as the poll
+                    print(f"[{tenant.name}] HTTP session expired, reauthenticating with the browser")
+                    status = await utils.check_class_status(page, context, tenant)
+                    if status == supervisor.OK and not await utils.save_cookies(context, tenant):
+                        status = supervisor.FAILED
+                    await poller.load_cookies()
+
+        print(f"[{tenant.name}] poll traffic: {slot.net_stats}")
+        slot.net_stats.reset()
+
+        # one search postback per watched course
+        tenant.scheduler.record_poll(len(tenant.watchlist))
+        metrics.POLLS.inc(tenant=tenant.name)
+        return status
+
+    # failed attempts are retried on the same slot, see supervisor.py
+    guard = supervisor.Supervisor(tenant, slot)
+
+    # main logic loop
+    while True:
+        if await guard.poll(attempt) != supervisor.OK:
+            # only a vacancy or auth that keeps failing get here
+            print(f"[{tenant.name}] Script concluding")
+            break
+        tenant.scheduler.record_success()
+        # an unchanged page is a completed poll too
+        metrics.LAST_SUCCESS.set(utils.time.time(), tenant=tenant.name)
+        metrics.mark_startup("first_poll")
+        await utils.asyncio.sleep(tenant.scheduler.next_delay())
+
+    if keeper_task is not None:
+        keeper_task.cancel()
+    if enroll_task is not None:
+        enroll_task.cancel()
+    if poller is not None:
+        await poller.close()
+    await lifecycle.release(slot)
+
 async def run_script():
-    
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=utils.config.HEADLESS)
-        context = await browser.new_context()
 
-        await context.add_cookies(utils.config.initial_cookies)
+    async with async_playwright() as p:
+        # one Chromium for every account, each tenant only adds a BrowserContext
+        page_slots = utils.asyncio.Semaphore(utils.config.MAX_CONCURRENT_PAGES)
+        lifecycle = Lifecycle(p, page_slots)
+        await lifecycle.launch()
 
-        # Load cookies from the last session
-        if not await utils.load_cookies(context):
-            raise Exception(
-                "Could not load cookies from previous run. Abort Abort Abort!!!")
-        
-        page = await context.new_page()
+        # watchlist.json wins over config.py, and is reloaded while we run
+        watchlist.load()
+        watcher = utils.asyncio.create_task(watchlist.watch())
 
-        # main logic loop
+        # tenant name -> its run, a tenant that concluded is not started again
+        runs = {}
+        told_idle = False
         while True:
-
-            if not await utils.check_class_status(page, context):
-                # this function will return true if it didn't have an issue and that the class is still full
-                print("Script concluding")
+            # a tenant that started idle gets going once the file or the control API gives it work
+            for tenant in tenants.load_all():
+                if tenant.name not in runs:
+                    runs[tenant.name] = utils.asyncio.create_task(run_tenant(lifecycle, tenant, page_slots))
+            pending = [run for run in runs.values() if not run.done()]
+            if runs and not pending:
                 break
-            await utils.asyncio.sleep(randint(3, 6) + randint(randint(-2, 1), randint(1, 3)))
+            if not runs and not told_idle:
+                print("No tenant has anything to watch yet, waiting for watchlist.json or the control API")
+                told_idle = True
+            await utils.asyncio.wait(pending or [watcher], timeout=utils.config.WATCHLIST_CHECK_INTERVAL)
+        watcher.cancel()
+        for name, run in runs.items():
+            if run.exception() is not None:
+                print(f"Tenant {name} ended with an exception: {run.exception()}")
 
-        if not await utils.save_cookies(context):
-            raise Exception("Could not save cookies.")
-        await browser.close()
+        await lifecycle.close()
+        # vacancy alerts and error digests still in the queue
+        await utils.notifier.get().drain()
 
 if __name__ == "__main__":
-    
+
+    # SQLite connections stay on the thread that opened them, this one runs the event loop
+    history.store()
     health_thread = threading.Thread(target=utils.start_health_server, daemon=True)
     health_thread.start()
-    
-    utils.asyncio.run(run_script())
\ No newline at end of file
+
+    utils.asyncio.run(run_script())
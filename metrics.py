@@ -0,0 +1,216 @@
+# metrics.py
+# Minimal Prometheus text-format metrics, served on /metrics by health_server.
+# Updated from the scanner's event loop, rendered from the health server thread.
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+import tracer
+
+_lock = threading.Lock()
+_registry = []
+# main.py imports this module first, so startup milestones count from about the start of the process
+_started = time.perf_counter()
+# Chromium is looked for below this pid, lifecycle.py points it at browserd.py when attached to its browser
+browser_root_pid = os.getpid()
+
+
+def _labels(labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+class Counter:
+
+    def __init__(self, name, help):
+        self.name, self.help, self.kind = name, help, "counter"
+        self.values = {}
+        _registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with _lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        return [(self.name, key, value) for key, value in self.values.items()]
+
+
+class Gauge(Counter):
+
+    def __init__(self, name, help, callback=None):
+        super().__init__(name, help)
+        self.kind = "gauge"
+        # computed at scrape time instead of set, e.g. the browser RSS
+        self.callback = callback
+
+    def set(self, value, **labels):
+        with _lock:
+            self.values[tuple(sorted(labels.items()))] = value
+
+    def samples(self):
+        if self.callback is not None:
+            value = self.callback()
+            return [] if value is None else [(self.name, (), value)]
+        return super().samples()
+
+
+class Histogram:
+
+    def __init__(self, name, help, buckets):
+        self.name, self.help, self.kind = name, help, "histogram"
+        self.buckets = tuple(buckets)
+        self.values = {}  # labels -> [bucket counts..., sum, count]
+        _registry.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with _lock:
+            entry = self.values.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[i] += 1
+            entry[-2] += value
+            entry[-1] += 1
+
+    def samples(self):
+        samples = []
+        for key, entry in self.values.items():
+            for bound, count in zip(self.buckets, entry):
+                samples.append((self.name + "_bucket", key + (("le", repr(float(bound))),), count))
+            samples.append((self.name + "_bucket", key + (("le", "+Inf"),), entry[-1]))
+            samples.append((self.name + "_sum", key, entry[-2]))
+            samples.append((self.name + "_count", key, entry[-1]))
+        return samples
+
+
+def render() -> str:
+    """Every registered metric in the Prometheus text exposition format."""
+    lines = []
+    with _lock:
+        snapshot = [(metric, metric.samples()) for metric in _registry]
+    for metric, samples in snapshot:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for name, labels, value in samples:
+            lines.append(f"{name}{_labels(labels)} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def _browser_pids():
+    """Pids of every Chromium process started below browser_root_pid, None where /proc is not available."""
+    try:
+        parents = {}
+        for pid in os.listdir('/proc'):
+            if pid.isdigit():
+                try:
+                    with open(f'/proc/{pid}/stat') as f:
+                        # the command name can contain spaces, ppid is the 2nd field after it
+                        parents[int(pid)] = int(f.read().rsplit(')', 1)[1].split()[1])
+                except OSError:
+                    continue
+    except OSError:
+        return None
+
+    descendants, frontier = set(), {browser_root_pid}
+    while frontier:
+        frontier = {pid for pid, ppid in parents.items() if ppid in frontier} - descendants
+        descendants |= frontier
+
+    pids = []
+    for pid in descendants:
+        try:
+            with open(f'/proc/{pid}/comm') as f:
+                if f.read().startswith(('chrom', 'headless_shell')):
+                    pids.append(pid)
+        except OSError:
+            continue
+    return pids
+
+
+def _rss_bytes(pid):
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+def browser_rss_bytes():
+    """RSS of every Chromium process, None where /proc is not available."""
+    pids = _browser_pids()
+    if pids is None:
+        return None
+    return sum(_rss_bytes(pid) for pid in pids)
+
+
+def renderer_rss_bytes():
+    """RSS of the largest Chromium renderer process, None where /proc is not available."""
+    pids = _browser_pids()
+    if pids is None:
+        return None
+    largest = 0
+    for pid in pids:
+        try:
+            with open(f'/proc/{pid}/cmdline', 'rb') as f:
+                if b'--type=renderer' not in f.read():
+                    continue
+        except OSError:
+            continue
+        largest = max(largest, _rss_bytes(pid))
+    return largest
+
+
+def browser_cpu_seconds():
+    """User + system CPU of the live Chromium processes, None where /proc is not available."""
+    pids = _browser_pids()
+    if pids is None:
+        return None
+    ticks = 0
+    for pid in pids:
+        try:
+            with open(f'/proc/{pid}/stat') as f:
+                # utime and stime are the 12th and 13th fields after the command name
+                fields = f.read().rsplit(')', 1)[1].split()
+            ticks += int(fields[11]) + int(fields[12])
+        except OSError:
+            continue
+    return ticks / os.sysconf('SC_CLK_TCK')
+
+
+STAGE_SECONDS = Histogram(
+    "scanner_stage_seconds", "Duration of each step of a poll or auth flow",
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60))
+POLLS = Counter("scanner_polls_total", "Poll cycles run")
+VACANCIES = Counter("scanner_vacancies_total", "Watched sections found with open seats")
+ERRORS = Counter("scanner_errors_total", "Errors handled by utils.handle_error")
+REAUTHS = Counter("scanner_reauths_total", "CAS and Duo authentications started")
+LAST_SUCCESS = Gauge("scanner_last_successful_poll_timestamp_seconds", "Unix time of the last poll that completed, by tenant")
+BROWSER_RSS = Gauge("scanner_browser_rss_bytes", "Resident memory of all Chromium processes", callback=browser_rss_bytes)
+STARTUP_SECONDS = Gauge("scanner_startup_seconds", "Seconds from start to imports done, browser ready and the first finished poll")
+
+
+def mark_startup(phase):
+    """Record a startup milestone the first time it is reached."""
+    key = (("phase", phase),)
+    with _lock:
+        if key in STARTUP_SECONDS.values:
+            return
+        STARTUP_SECONDS.values[key] = elapsed = time.perf_counter() - _started
+    print(f"Startup: {phase} after {elapsed:.2f} s")
+
+
+@contextmanager
+def stage(name):
+    """Time a block into scanner_stage_seconds{stage=name}, and as a span of the current trace."""
+    start = time.perf_counter()
+    try:
+        with tracer.span(name):
+            yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage=name)
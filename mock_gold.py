@@ -0,0 +1,291 @@
+# mock_gold.py
+# Local stand-in for GOLD, CAS and Duo, for bench.py and for trying changes
+# without touching the UCSB servers. Serves the same selectors the scanner
+# uses: the BasicFindCourses.aspx postback form, result rows with
+# div[data-target] and the space/max columns, a CAS login form and a Duo
+# iframe whose HOTP passcodes are checked against a server-side counter.
+#
+#   uvicorn mock_gold:app --port 8800
+#   GOLD_URL=http://127.0.0.1:8800/gold CAS_LOGIN_URL=/cas/login python main.py
+
+import os
+import random
+import secrets
+import time
+from urllib.parse import parse_qs, quote
+import pyotp
+from fastapi import FastAPI, Request
+from fastapi.responses import HTMLResponse, RedirectResponse
+
+MOCK_USERNAME = os.environ.get('MOCK_USERNAME', 'mock-user')
+MOCK_PASSWORD = os.environ.get('MOCK_PASSWORD', 'mock-pass')
+MOCK_HOTP_KEY = os.environ.get('MOCK_HOTP_KEY', 'JBSWY3DPEHPK3PXP')
+# how far ahead of the server counter a passcode may be, like Duo's look-ahead
+HOTP_WINDOW = 10
+# chance per section per result render that its seat count moves
+CHURN = float(os.environ.get('MOCK_CHURN', '0.02'))
+# added to every response, seconds
+LATENCY = float(os.environ.get('MOCK_LATENCY', '0'))
+SECTIONS_PER_COURSE = int(os.environ.get('MOCK_SECTIONS', '12'))
+
+QUARTERS = ["20251", "20252", "20253", "20254"]
+SUBJECTS = ["PSTAT", "CMPSC", "MATH", "ECON"]
+
+app = FastAPI()
+
+
+class MockState:
+
+    def __init__(self):
+        self.hotp_counter = 0
+        self.tgcs = set()  # CAS ticket-granting cookies
+        self.gold_sessions = {}  # session id -> search criteria
+        self.duo_pending = {}  # duo sid -> service url
+        self.duo_remembered = {}  # remember cookie -> expiry
+        self.courses = {}  # (quarter, subject, number) -> [[section, space, max, days, instructor, time]]
+        self.counts = {"searches": 0, "cas_logins": 0, "duo_ok": 0, "duo_rejected": 0}
+
+    def sections(self, course):
+        if course not in self.courses:
+            rng = random.Random(repr(course))
+            base = 40000 + rng.randrange(1000, 9000)
+            self.courses[course] = [
+                [str(base + i), "Full", str(rng.choice([25, 30, 40, 60])),
+                 rng.choice(["M W", "T R", "M W F"]), rng.choice(["SMITH J", "NGUYEN T", "GARCIA M", "TBA"]),
+                 rng.choice(["8:00 AM - 9:15 AM", "11:00 AM - 12:15 PM", "2:00 PM - 3:15 PM", "5:00 PM - 6:15 PM"])]
+                for i in range(SECTIONS_PER_COURSE)
+            ]
+        for section in self.courses[course]:
+            if random.random() < CHURN:
+                section[1] = "Full" if section[1] != "Full" else str(random.randint(1, 3))
+        return self.courses[course]
+
+
+state = MockState()
+
+
+def page(title, body, status=200, cookies=None):
+    response = HTMLResponse(
+        f"<!DOCTYPE html><html><head><title>{title}</title></head><body>{body}</body></html>", status_code=status)
+    for name, value in (cookies or {}).items():
+        response.set_cookie(name, value, path="/", httponly=True)
+    return response
+
+
+async def form_fields(request) -> dict:
+    return {key: values[0] for key, values in parse_qs((await request.body()).decode()).items()}
+
+
+@app.middleware("http")
+async def add_latency(request, call_next):
+    if LATENCY:
+        import asyncio
+        await asyncio.sleep(LATENCY)
+    return await call_next(request)
+
+
+# GOLD
+
+def gold_session(request):
+    """(session id, set-cookie dict) for a CAS-authenticated browser, or None."""
+    sid = request.cookies.get("ASP.NET_SessionId")
+    if sid in state.gold_sessions:
+        return sid, {}
+    if request.cookies.get("CASTGC") in state.tgcs:
+        sid = secrets.token_hex(12)
+        state.gold_sessions[sid] = None
+        return sid, {"ASP.NET_SessionId": sid}
+    return None
+
+
+def to_cas(request):
+    return RedirectResponse(f"/cas/login?service={quote(str(request.url))}", status_code=302)
+
+
+def options(name, values):
+    return f'<select name="{name}">' + "".join(f'<option value="{v}">{v}</option>' for v in values) + "</select>"
+
+
+@app.get("/gold/BasicFindCourses.aspx")
+async def find_courses(request: Request):
+    session = gold_session(request)
+    if session is None:
+        return to_cas(request)
+    sid, cookies = session
+    return page("Find Courses", f"""
+<form method="post" action="BasicFindCourses.aspx" id="aspnetForm">
+<input type="hidden" name="__EVENTTARGET" value=""><input type="hidden" name="__EVENTARGUMENT" value="">
+<input type="hidden" name="__LASTFOCUS" value="">
+<input type="hidden" name="__VIEWSTATE" value="{sid}">
+<input type="hidden" name="__EVENTVALIDATION" value="{sid[::-1]}">
+{options("ctl00$pageContent$quarterDropDown", QUARTERS)}
+{options("ctl00$pageContent$subjectAreaDropDown", SUBJECTS)}
+<input type="text" name="ctl00$pageContent$courseNumberTextBox" value="">
+<input type="hidden" name="ctl00$pageContent$HiddenTextBox" value="">
+<input type="submit" name="ctl00$pageContent$searchButton" value="Search">
+</form>""", cookies=cookies)
+
+
+@app.post("/gold/BasicFindCourses.aspx")
+async def search_postback(request: Request):
+    session = gold_session(request)
+    if session is None:
+        return to_cas(request)
+    sid, _ = session
+    fields = await form_fields(request)
+    if fields.get("__VIEWSTATE") != sid or fields.get("__EVENTVALIDATION") != sid[::-1]:
+        return page("Error", "Invalid postback or callback argument.", status=500)
+    state.gold_sessions[sid] = (
+        fields.get("ctl00$pageContent$quarterDropDown"),
+        fields.get("ctl00$pageContent$subjectAreaDropDown"),
+        fields.get("ctl00$pageContent$courseNumberTextBox", "").strip().upper(),
+    )
+    state.counts["searches"] += 1
+    return RedirectResponse("/gold/ResultsFindCourses.aspx", status_code=302)
+
+
+@app.get("/gold/ResultsFindCourses.aspx")
+async def results(request: Request):
+    session = gold_session(request)
+    if session is None:
+        return to_cas(request)
+    sid, cookies = session
+    criteria = state.gold_sessions.get(sid)
+    if criteria is None:
+        return RedirectResponse("/gold/BasicFindCourses.aspx", status_code=302)
+
+    quarter, subject, number = criteria
+    # a subject-wide search (empty course number) lists a handful of courses
+    numbers = [number] if number else ["5A", "10", "109", "120A", "120B", "120C", "126", "160A"] + [str(n) for n in range(130, 200, 4)]
+    rows = []
+    for course_number in numbers:
+        rows.append(f'<div class="courseSearchItem"><div class="row courseTitle"><span class="courseTitle">{subject} {course_number}</span></div>')
+        for section, space, max_seats, days, instructor, time_range in state.sections((quarter, subject, course_number)):
+            rows.append(f"""<div class="row susbSessionItem" data-target="#info{section}">
+<div class="col-lg-search-days col-md-days">{days}</div>
+<div class="col-lg-search-instructor col-md-instructor">{instructor}</div>
+<div class="col-lg-search-time col-md-time">{time_range}</div>
+<div class="col-lg-search-space col-md-space col-sm-push-1 col-sm-space col-xs-2">{space}</div>
+<div class="col-lg-days col-md-space col-sm-push-1 col-sm-space col-xs-2">{max_seats}</div>
+</div>""")
+        rows.append("</div>")
+    return page("Course Search Results", "\n".join(rows), cookies=cookies)
+
+
+# CAS
+
+@app.get("/cas/login")
+async def cas_login_form(request: Request, service: str = "/gold/BasicFindCourses.aspx"):
+    if request.cookies.get("CASTGC") in state.tgcs:
+        return RedirectResponse(service, status_code=302)
+    return page("Log In - UCSB Authentication Service", f"""
+<form method="post" action="/cas/login?service={quote(service)}">
+<input id="username" name="username" type="text">
+<input id="password" name="password" type="password">
+<input name="submit" class="btn btn-block btn-submit" type="submit" value="LOGIN">
+</form>""")
+
+
+@app.post("/cas/login")
+async def cas_login(request: Request, service: str = "/gold/BasicFindCourses.aspx"):
+    fields = await form_fields(request)
+    if fields.get("username") != MOCK_USERNAME or fields.get("password") != MOCK_PASSWORD:
+        return page("Log In - UCSB Authentication Service", "Invalid credentials.", status=401)
+    state.counts["cas_logins"] += 1
+
+    remembered = state.duo_remembered.get(request.cookies.get("duo_remember"), 0)
+    if remembered > time.time():
+        return duo_complete(service)
+
+    duo_sid = secrets.token_hex(8)
+    state.duo_pending[duo_sid] = service
+    return page("Duo Security - Two-Factor Authentication",
+                f'<iframe id="duo_iframe" src="/duo/frame?sid={duo_sid}" width="600" height="400"></iframe>')
+
+
+def duo_complete(service):
+    tgc = secrets.token_hex(12)
+    state.tgcs.add(tgc)
+    response = RedirectResponse(service, status_code=302)
+    response.set_cookie("CASTGC", tgc, path="/", httponly=True)
+    return response
+
+
+@app.get("/cas/duo-complete")
+async def cas_duo_complete(sid: str):
+    service = state.duo_pending.pop(sid, None)
+    if service is None:
+        return page("Log In - UCSB Authentication Service", "Duo session expired.", status=403)
+    return duo_complete(service)
+
+
+# Duo
+
+@app.get("/duo/frame")
+async def duo_frame(sid: str):
+    fieldsets = "".join(f"""
+<fieldset data-device-index="{device}" style="display: none">
+<button id="passcode" class="positive auth-button" type="button" onclick="passcodeClicked(this)">Enter a Passcode</button>
+<div class="passcode-input-wrapper"><input name="passcode" type="text" style="display: none"></div>
+</fieldset>""" for device in ("phone1", "phone2"))
+    return page("Duo Frame", f"""
+<form id="login-form" method="post" action="/duo/verify?sid={sid}">
+<fieldset><div><select name="device" onchange="showDevice(this.value)">
+<option value="phone1">Phone 1</option><option value="phone2">Phone 2</option></select></div></fieldset>
+<label><input type="checkbox" name="dampen_choice" value="true"> Remember me for 10 hours</label>
+{fieldsets}
+</form>
+<script>
+function showDevice(device) {{
+    document.querySelectorAll('fieldset[data-device-index]').forEach(f => {{
+        f.style.display = f.dataset.deviceIndex === device ? 'block' : 'none';
+    }});
+}}
+function passcodeClicked(button) {{
+    const input = button.parentElement.querySelector('input[name="passcode"]');
+    if (input.style.display === 'none') {{ input.style.display = 'inline'; input.focus(); return; }}
+    const form = document.getElementById('login-form');
+    form.querySelectorAll('input[name="passcode"]').forEach(i => {{ if (i !== input) i.disabled = true; }});
+    form.submit();
+}}
+showDevice('phone1');
+</script>""")
+
+
+@app.post("/duo/verify")
+async def duo_verify(request: Request, sid: str):
+    fields = await form_fields(request)
+    hotp = pyotp.HOTP(MOCK_HOTP_KEY)
+    code = fields.get("passcode", "")
+    for counter in range(state.hotp_counter, state.hotp_counter + HOTP_WINDOW):
+        if hotp.verify(code, counter):
+            state.hotp_counter = counter + 1
+            break
+    else:
+        state.counts["duo_rejected"] += 1
+        return page("Duo Frame", "Incorrect passcode. Enter a new passcode.")
+
+    state.counts["duo_ok"] += 1
+    body = f"<script>window.top.location = '/cas/duo-complete?sid={sid}';</script>"
+    response = page("Duo Frame", body)
+    if fields.get("dampen_choice"):
+        remember = secrets.token_hex(8)
+        state.duo_remembered[remember] = time.time() + 10 * 3600
+        response.set_cookie("duo_remember", remember, path="/", httponly=True)
+    return response
+
+
+# Control
+
+@app.get("/mock/state")
+async def mock_state():
+    return {"hotp_counter": state.hotp_counter, **state.counts}
+
+
+@app.post("/mock/expire")
+async def mock_expire():
+    """Drop every GOLD and CAS session (and remembered Duo devices) so the next poll has to reauthenticate."""
+    state.tgcs.clear()
+    state.gold_sessions.clear()
+    state.duo_remembered.clear()
+    return {"expired": True}
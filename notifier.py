@@ -0,0 +1,90 @@
+# notifier.py
+# Email delivery off the poll loop. Vacancy alerts have their own queue and
+# SMTP connection so they never wait behind error mail; errors go through a
+# second long-lived connection and repeats of the same error within
+# ERROR_DIGEST_WINDOW are folded into one digest mail.
+
+import asyncio
+from datetime import datetime
+import config
+from emailsender import SmtpSession, build_message
+
+
+class Notifier:
+
+    def __init__(self):
+        self.urgent = asyncio.Queue()
+        self.queue = asyncio.Queue()
+        self.urgent_session = SmtpSession()
+        self.session = SmtpSession()
+        # error key -> [first seen, last seen, repeats, subject, last body, to_email]
+        self.digests = {}
+        self.workers = [
+            asyncio.create_task(self._work(self.urgent, self.urgent_session)),
+            asyncio.create_task(self._work(self.queue, self.session)),
+        ]
+
+    async def _work(self, queue, session):
+        while True:
+            subject, body, to_email = await queue.get()
+            try:
+                await asyncio.to_thread(session.send, build_message(subject, body, to_email))
+                print(f"Email sent successfully to {to_email}")
+            except Exception as e:
+                print(f"An error occurred while sending the email: {e}")
+            finally:
+                queue.task_done()
+
+    def vacancy(self, subject, body, to_email):
+        """Send right away on the dedicated connection."""
+        self.urgent.put_nowait((subject, body, to_email))
+
+    def message(self, subject, body, to_email):
+        self.queue.put_nowait((subject, body, to_email))
+
+    def error(self, key, subject, body, to_email):
+        """Send the first error of a kind now, count repeats and mail them as one digest later."""
+        key = (to_email, key)
+        now = datetime.now()
+        if key in self.digests:
+            digest = self.digests[key]
+            digest[1] = now
+            digest[2] += 1
+            digest[4] = body
+            return
+
+        self.digests[key] = [now, now, 0, subject, body, to_email]
+        self.message(subject, body, to_email)
+        asyncio.get_running_loop().call_later(config.ERROR_DIGEST_WINDOW, self._flush_digest, key)
+
+    def _flush_digest(self, key):
+        if key not in self.digests:
+            return  # already flushed by drain
+        first, last, repeats, subject, body, to_email = self.digests.pop(key)
+        if repeats:
+            self.message(
+                f"{subject} (x{repeats} more)",
+                f"The same error happened {repeats} more times between {first} and {last}.\nLast occurrence:\n\n{body}",
+                to_email)
+
+    async def drain(self):
+        """Send every pending digest and wait for both queues to empty, e.g. before exiting."""
+        for key in list(self.digests):
+            self._flush_digest(key)
+        await self.urgent.join()
+        await self.queue.join()
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.to_thread(self.urgent_session.close)
+        await asyncio.to_thread(self.session.close)
+
+
+_notifier = None
+
+
+def get() -> Notifier:
+    """The process-wide notifier, its workers start on the running loop at first use."""
+    global _notifier
+    if _notifier is None:
+        _notifier = Notifier()
+    return _notifier
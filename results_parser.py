@@ -0,0 +1,214 @@
+# results_parser.py
+# Section rows of a GOLD result page, read either in the browser with a single
+# page.evaluate (EXTRACT_ROWS_JS) or from plain HTML for the browserless poller,
+# or row by row while a large subject-wide page streams in (catalog.py).
+
+import re
+from html.parser import HTMLParser
+from typing import NamedTuple, Optional
+
+# columns of a `div[data-target]` result row, in SectionRow field order
+SPACE_COLUMN = 'col-lg-search-space col-md-space col-sm-push-1 col-sm-space col-xs-2'
+MAX_COLUMN = 'col-lg-days col-md-space col-sm-push-1 col-sm-space col-xs-2'
+DAYS_COLUMN = 'col-lg-search-days col-md-days'
+INSTRUCTOR_COLUMN = 'col-lg-search-instructor col-md-instructor'
+TIME_COLUMN = 'col-lg-search-time col-md-time'
+COLUMNS = (SPACE_COLUMN, MAX_COLUMN, DAYS_COLUMN, INSTRUCTOR_COLUMN, TIME_COLUMN)
+
+# enrollment codes are five digits, the data-target is "#info42747". Anchored on "info": other digit runs
+# in a target (a quarter code like 20251) are not the section. Targets in another format are kept whole.
+SECTION_RE = re.compile(r'info(\d{5})(?!\d)')
+
+# tags that never get an end tag, they must not count towards nesting depth
+VOID_TAGS = frozenset('area base br col embed hr img input link meta param source track wbr'.split())
+
+# every row in one CDP round trip, the first matching element of each column wins
+EXTRACT_ROWS_JS = """(columns) => Array.from(document.querySelectorAll('div[data-target]'), row => [
+    row.getAttribute('data-target'),
+    ...columns.map(selector => {
+        const element = row.querySelector(selector);
+        return element ? element.innerText.trim() : null;
+    }),
+])"""
+
+
+class SectionRow(NamedTuple):
+    section: str
+    space: Optional[str]
+    max_seats: Optional[str]
+    days: Optional[str]
+    instructor: Optional[str]
+    time: Optional[str] = None
+
+    @classmethod
+    def from_target(cls, target, space, max_seats, days, instructor, time=None):
+        match = SECTION_RE.search(target)
+        return cls(match.group(1) if match else target, space, max_seats, days, instructor, time)
+
+    @property
+    def has_vacancy(self) -> bool:
+        return self.space is not None and "Full" not in self.space
+
+    def __str__(self):
+        return f"{self.space} | {self.max_seats} | Section: {self.section}"
+
+
+async def extract_rows(page) -> list:
+    """All section rows of the result page loaded in `page`."""
+    selectors = ['.' + '.'.join(column.split()) for column in COLUMNS]
+    return [SectionRow.from_target(*row) for row in await page.evaluate(EXTRACT_ROWS_JS, selectors)]
+
+
+class ResultsParser(HTMLParser):
+    """Collects a SectionRow for every `div[data-target]` row of a result page."""
+
+    COLUMN_CLASSES = tuple(frozenset(column.split()) for column in COLUMNS)
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self._rows = []  # [data-target, space, max, days, instructor, time]
+        self._depth = 0
+        self._open_rows = []  # (depth, row) for rows we are inside of
+        self._capture = None  # (depth, field index, text parts)
+
+    @property
+    def rows(self) -> list:
+        return [SectionRow.from_target(*row) for row in self._rows]
+
+    def handle_starttag(self, tag, attrs):
+        if tag in VOID_TAGS:
+            return
+        self._depth += 1
+        attrs = dict(attrs)
+
+        if tag == 'div' and attrs.get('data-target') is not None:
+            row = [attrs['data-target'], None, None, None, None, None]
+            self._row_opened(row)
+            self._open_rows.append((self._depth, row))
+            return
+
+        if self._open_rows and self._capture is None:
+            classes = set((attrs.get('class') or '').split())
+            for field, column in enumerate(self.COLUMN_CLASSES, start=1):
+                if column <= classes:
+                    self._capture = (self._depth, field, [])
+                    break
+
+    def handle_endtag(self, tag):
+        if tag in VOID_TAGS:
+            return
+
+        if self._capture is not None and self._capture[0] == self._depth:
+            _, field, parts = self._capture
+            text = ' '.join(''.join(parts).split())
+            # like querySelector on the row, the first matching column wins
+            for _, row in self._open_rows:
+                if row[field] is None:
+                    row[field] = text
+            self._capture = None
+
+        while self._open_rows and self._open_rows[-1][0] >= self._depth:
+            self._row_closed(self._open_rows.pop()[1])
+        self._depth -= 1
+
+    def handle_data(self, data):
+        if self._capture is not None:
+            self._capture[2].append(data)
+
+    def _row_opened(self, row):
+        self._rows.append(row)
+
+    def _row_closed(self, row):
+        pass
+
+
+class StreamingResultsParser(ResultsParser):
+    """ResultsParser for large subject-wide result pages, fed chunk by chunk as they arrive.
+
+    Each row goes to `on_row(course_title, SectionRow)` once its element closes and is not kept, so memory
+    doesn't grow with the page. `course_title` is the text of the last element with class `title_class` before it.
+    """
+
+    def __init__(self, on_row, title_class):
+        super().__init__()
+        self.on_row = on_row
+        self.title_class = title_class
+        self.course_title = None
+        self.count = 0
+        self._title = None  # (depth, text parts)
+
+    def handle_starttag(self, tag, attrs):
+        super().handle_starttag(tag, attrs)
+        if tag in VOID_TAGS or self._open_rows or self._title is not None:
+            return
+        if self.title_class in (dict(attrs).get('class') or '').split():
+            self._title = (self._depth, [])
+
+    def handle_endtag(self, tag):
+        if self._title is not None and tag not in VOID_TAGS and self._title[0] == self._depth:
+            self.course_title = ' '.join(''.join(self._title[1]).split())
+            self._title = None
+        super().handle_endtag(tag)
+
+    def handle_data(self, data):
+        super().handle_data(data)
+        if self._title is not None:
+            self._title[1].append(data)
+
+    def _row_opened(self, row):
+        pass
+
+    def _row_closed(self, row):
+        self.count += 1
+        self.on_row(self.course_title, SectionRow.from_target(*row))
+
+
+class FormFieldsParser(HTMLParser):
+    """Collects the hidden inputs (__VIEWSTATE, __EVENTVALIDATION, ...) of an ASP.NET form."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.fields = {}
+
+    def handle_starttag(self, tag, attrs):
+        if tag != 'input':
+            return
+        attrs = dict(attrs)
+        if (attrs.get('type') or '').lower() == 'hidden' and attrs.get('name'):
+            self.fields[attrs['name']] = attrs.get('value') or ''
+
+    handle_startendtag = handle_starttag
+
+
+def parse_rows(html) -> list:
+    parser = ResultsParser()
+    parser.feed(html)
+    parser.close()
+    return parser.rows
+
+
+def parse_hidden_fields(html) -> dict:
+    parser = FormFieldsParser()
+    parser.feed(html)
+    parser.close()
+    return parser.fields
+
+
+def find_sections(rows, sections) -> dict:
+    """Map each watched section to its SectionRow, the first row for a section wins."""
+    by_section = {}
+    for row in rows:
+        by_section.setdefault(row.section, row)
+
+    found = {}
+    for section in sections:
+        row = by_section.get(section)
+        if row is None:
+            # a target SECTION_RE doesn't know, matched like data-target*="<section>"
+            row = next((row for row in rows if section in row.section), None)
+        if row is None:
+            raise Exception(f"Could not find the target class information for section {section}.")
+        if row.space is None:
+            raise Exception(f"Could not find class status information for section {section}.")
+        found[section] = row
+    return found
@@ -0,0 +1,92 @@
+# scheduler.py
+# Sleep between polls, learned from when seat counts actually change.
+# Sections that just moved and hours that were busy before get polled near
+# POLL_MIN_INTERVAL, quiet hours drift towards POLL_MAX_INTERVAL, errors and
+# reauths back off, and the hourly request budget is never exceeded.
+
+import random
+import time
+from collections import deque
+from datetime import datetime
+import config
+
+
+class PollScheduler:
+
+    def __init__(self):
+        self.last_change = None  # monotonic time of the last seat change on any section
+        # seat changes per hour of day, halved every SCHEDULER_HALF_LIFE_DAYS
+        self.hourly_changes = [0.0] * 24
+        self._decayed_at = time.monotonic()
+        self.backoff = 1.0
+        # a login happened since the last next_delay()
+        self.reauthed = False
+        self.polls = deque()  # (monotonic time, requests) within the last hour
+
+    def seed(self, change_times):
+        """Learn the busy hours from past change timestamps, e.g. history.SeatHistory.change_times()."""
+        now = time.time()
+        for ts in change_times:
+            age_days = (now - ts) / 86400
+            self.hourly_changes[datetime.fromtimestamp(ts).hour] += 0.5 ** (age_days / config.SCHEDULER_HALF_LIFE_DAYS)
+
+    def record_change(self, when):
+        """A watched course had a seat count change at `when` (datetime)."""
+        self._decay()
+        self.last_change = time.monotonic()
+        self.hourly_changes[when.hour] += 1
+
+    def _decay(self):
+        now = time.monotonic()
+        factor = 0.5 ** ((now - self._decayed_at) / (config.SCHEDULER_HALF_LIFE_DAYS * 86400))
+        self.hourly_changes = [count * factor for count in self.hourly_changes]
+        self._decayed_at = now
+
+    def record_poll(self, requests=1):
+        self.polls.append((time.monotonic(), requests))
+
+    def record_success(self):
+        self.backoff = max(1.0, self.backoff / 2)
+
+    def record_error(self):
+        self.backoff = min(config.POLL_BACKOFF_MAX, self.backoff * 2)
+
+    def record_reauth(self):
+        # a reauth is not our fault, but hammering right after one looks suspicious. Only the next sleep
+        # is stretched: as a backoff, the same poll's record_success() would halve it away at once
+        self.reauthed = True
+
+    def _activity(self, hour) -> float:
+        """How busy this hour of day has been, 0 (never a change) to 1 (busiest hour)."""
+        busiest = max(self.hourly_changes)
+        if busiest <= 0:
+            return 0.5  # nothing learned yet, stay in the middle
+        return self.hourly_changes[hour] / busiest
+
+    def _budget_wait(self, now) -> float:
+        """Seconds until another poll fits into the hourly request budget."""
+        while self.polls and now - self.polls[0][0] > 3600:
+            self.polls.popleft()
+        used = sum(requests for _, requests in self.polls)
+        if used < config.POLL_REQUEST_BUDGET:
+            return 0.0
+        return 3600 - (now - self.polls[0][0])
+
+    def next_delay(self) -> float:
+        low, high = config.POLL_MIN_INTERVAL, config.POLL_MAX_INTERVAL
+        now = time.monotonic()
+
+        if self.last_change is not None and now - self.last_change < config.CHURN_WINDOW:
+            # seats are moving right now
+            delay = low
+        else:
+            delay = high - (high - low) * self._activity(datetime.now().hour)
+
+        delay *= self.backoff
+        if self.reauthed:
+            delay *= 1.5
+            self.reauthed = False
+        # randomized so the polls don't form a pattern
+        delay *= random.uniform(1 - config.POLL_JITTER, 1 + config.POLL_JITTER)
+        delay = max(low, min(delay, high * config.POLL_BACKOFF_MAX))
+        return max(delay, self._budget_wait(now))
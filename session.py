@@ -0,0 +1,191 @@
+# session.py
+# Keeps the GOLD page warm between polls. A cold session does the full
+# navigate -> CAS check -> navigate dance; once a search has run, the next tick
+# only reloads its result page, or re-submits the search form that is already
+# loaded. Any redirect to sso.ucsb.edu or unexpected page drops back to cold.
+
+import time
+import weakref
+import capture
+import config
+import cookie_store
+import governor
+import metrics
+import tracer
+import utils
+
+SEARCH_URL = config.GOLD_URL + '/BasicFindCourses.aspx'
+CAS_LOGIN_URL = config.CAS_LOGIN_URL
+
+QUARTER_SELECT = 'select[name="ctl00$pageContent$quarterDropDown"]'
+SUBJECT_SELECT = 'select[name="ctl00$pageContent$subjectAreaDropDown"]'
+COURSE_INPUT = 'input[name="ctl00$pageContent$courseNumberTextBox"]'
+SEARCH_BUTTON = 'input[name="ctl00$pageContent$searchButton"]'
+
+# current values of the search form in one evaluate
+READ_FORM_JS = """([quarter, subject, course]) => [
+    document.querySelector(quarter)?.value ?? null,
+    document.querySelector(subject)?.value ?? null,
+    document.querySelector(course)?.value ?? null,
+]"""
+
+
+class GoldSession:
+    """Where a polling page currently is: cold, on the search form, or on a result page."""
+
+    COLD = "cold"
+    SEARCH = "search"
+    RESULTS = "results"
+
+    def __init__(self, page, context, tenant):
+        self.page = page
+        self.context = context
+        self.tenant = tenant
+        self.state = self.COLD
+        # course and url of the result page we are on, the url is only reused if it can be fetched with a GET
+        self.results_course = None
+        self.results_url = None
+
+    def reset(self):
+        """Forget the warm state, the next search starts with a full navigate."""
+        self.state = self.COLD
+        self.results_course = None
+        self.results_url = None
+
+    def _at_cas(self) -> bool:
+        return CAS_LOGIN_URL in self.page.url
+
+    async def open_search(self) -> bool:
+        """Cold path: navigate, reauthenticate through CAS/Duo if needed, land on the search form."""
+        page, tenant = self.page, self.tenant
+        if cookie_store.needs_auth(tenant):
+            # GOLD would only send us to CAS, login_cas navigates there itself
+            tracer.event("No live GOLD cookies in the jar, logging in without probing GOLD")
+            needs_login = True
+        else:
+            await governor.acquire(tenant)
+            with metrics.stage("navigate"):
+                await page.goto(SEARCH_URL, wait_until='domcontentloaded')
+            tracer.event("Attempting to access GOLD, page navigated")
+
+            await capture.snap(page, 'step-3-gold', tenant)
+            needs_login = self._at_cas()
+
+        # Check if we're at the CAS login page (State S1)
+        if needs_login:
+            tracer.event("Attempting Authentication, CAS Not Authenticated: URL: " + page.url)
+            await capture.snap(page, 'step-0-auth-possible', tenant)
+            async with tenant.auth_lock:
+                with tracer.span("auth"), governor.priority(governor.AUTH):
+                    if not await utils.login_cas(page, self.context, tenant):
+                        return False  # was not able to login at all
+            tenant.authed_at = time.time()
+            #save cookies
+            if not await utils.save_cookies(self.context, tenant):
+                raise Exception("Cookies did not fit in jar.")
+            tracer.event("Attempting to access GOLD, page navigated - checking against to see if at CAS login")
+            await capture.snap(page, 'step-4-gold', tenant)
+
+            # Go to GOLD page again, login_cas may have left us anywhere
+            await governor.acquire(tenant)
+            with metrics.stage("navigate"):
+                await page.goto(SEARCH_URL, wait_until='domcontentloaded')
+
+            # Check if we were redirected to the CAS login page
+            # if that's the case then we're hopeless since the auth function failed
+            # but still returned true somehow
+            if self._at_cas():
+                print("Reauthentication Failure: Both GOLD and CAS sessions are invalid")
+                raise Exception("Both GOLD and CAS sessions are invalid, and reauthentication failed.")
+
+        if not await page.query_selector(QUARTER_SELECT):
+            raise Exception(f"Search form not found, unexpected page: {page.url}")
+
+        tracer.event("Valid Session, continuing main logic.")
+        await capture.snap(page, 'step-5-gold', tenant)
+        self.state = self.SEARCH
+        return True
+
+    async def _refresh_results(self) -> bool:
+        """Re-fetch the result page of the last search, False if that did not give us results."""
+        tracer.event(f"Refreshing results at {self.results_url}")
+        await governor.acquire(self.tenant)
+        with metrics.stage("navigate"):
+            await self.page.goto(self.results_url, wait_until='domcontentloaded')
+        if self._at_cas():
+            tracer.event("Redirected to CAS while refreshing")
+            self.reset()
+            return False
+        try:
+            await self.page.wait_for_selector(config.RESULTS_READY_SELECTOR, state='attached', timeout=5000)
+        except Exception:
+            tracer.event(f"No results after refresh, unexpected page: {self.page.url}")
+            self.reset()
+            return False
+        return True
+
+    async def _submit(self, course):
+        """Submit the search form that is loaded, only touching the fields that differ."""
+        page = self.page
+        payload = utils.course_payload(course)
+        quarter = payload['ctl00$pageContent$quarterDropDown']
+        subject = payload['ctl00$pageContent$subjectAreaDropDown']
+        number = payload['ctl00$pageContent$courseNumberTextBox']
+
+        current = await page.evaluate(READ_FORM_JS, [QUARTER_SELECT, SUBJECT_SELECT, COURSE_INPUT])
+        if current[0] != quarter:
+            await page.select_option(QUARTER_SELECT, quarter)
+        if current[1] != subject:
+            await page.select_option(SUBJECT_SELECT, subject)
+        if current[2] != number:
+            await page.fill(COURSE_INPUT, number)
+        await governor.acquire(self.tenant)
+        with metrics.stage("search_postback"):
+            await page.click(SEARCH_BUTTON)
+            # the result rows are all we read, no need to wait for the network to go idle
+            await page.wait_for_selector(config.RESULTS_READY_SELECTOR, state='attached', timeout=15000)
+            # rows are read in one evaluate, make sure the parser is done with all of them
+            await page.wait_for_load_state('domcontentloaded')
+
+        self.state = self.RESULTS
+        self.results_course = course
+        # a postback that answered on the search url itself can't be re-fetched with a GET
+        self.results_url = page.url if not page.url.startswith(SEARCH_URL) else None
+
+    async def search(self, course) -> bool:
+        """Get the result page for `course` with as few round trips as the current state allows.
+
+        Returns False only when reauthentication failed.
+        """
+        if self.state == self.RESULTS and self.results_course == course and self.results_url:
+            if await self._refresh_results():
+                return True
+
+        if self.state == self.RESULTS:
+            # back to the form, one navigation instead of the cold path's two
+            await governor.acquire(self.tenant)
+            with metrics.stage("navigate"):
+                await self.page.goto(SEARCH_URL, wait_until='domcontentloaded')
+            if self._at_cas() or not await self.page.query_selector(QUARTER_SELECT):
+                tracer.event(f"Session lost going back to the search form: {self.page.url}")
+                self.reset()
+            else:
+                self.state = self.SEARCH
+
+        if self.state == self.COLD:
+            if not await self.open_search():
+                return False
+
+        tracer.event(f"Submitting search for {utils.course_name(course)}")
+        await self._submit(course)
+        return True
+
+
+_sessions = weakref.WeakKeyDictionary()
+
+
+def session_for(page, context, tenant) -> GoldSession:
+    """The GoldSession of a polling page, created cold on first use."""
+    if page not in _sessions:
+        _sessions[page] = GoldSession(page, context, tenant)
+    return _sessions[page]
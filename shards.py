@@ -0,0 +1,178 @@
+# shards.py
+# N sessions (BrowserContexts with their own cookie jars) polling one tenant's
+# watchlist in turn. Ticks come every scheduler interval / N and rotate over
+# the shards, so each session polls at the normal rate while the watchlist is
+# sampled N times as often. The first shard to see a seat claims it
+# (Tenant.claim_vacancy), results merge in the shared history store.
+
+import asyncio
+import time
+from collections import deque
+import config
+import enroll
+import keepalive
+import metrics
+import supervisor
+import utils
+
+SHARD_POLLS = metrics.Counter("scanner_shard_polls_total", "Polls per shard by result")
+SHARD_UP = metrics.Gauge("scanner_shard_up", "1 while a shard is polling, 0 once it gave up")
+
+# tenant name -> ShardSet, read by the health server
+registry = {}
+
+
+class Shard:
+
+    # seconds of polls counted into polls_per_minute
+    RATE_WINDOW = 600
+
+    def __init__(self, index, tenant):
+        self.index = index
+        self.tenant = tenant
+        self.slot = None  # lifecycle.Slot
+        self.supervisor = None
+        self.busy = False
+        self.up = True
+        self.polls = 0
+        self.errors = 0
+        self.consecutive_errors = 0
+        self.skipped = 0  # ticks that came while this shard was still busy
+        self.last_success = None
+        self.last_duration = None
+        self.recent = deque()  # monotonic poll times of the last RATE_WINDOW
+
+    async def open(self, lifecycle):
+        self.slot = await lifecycle.open(self.tenant)
+        self.supervisor = supervisor.Supervisor(self.tenant, self.slot)
+
+    async def poll(self, lifecycle, page_slots) -> str:
+        """One poll, retried by the shard's supervisor until it succeeds, finds a seat or auth gives up."""
+        async def attempt():
+            await lifecycle.maintain(self.slot)
+            async with page_slots:
+                return await utils.check_class_status(self.slot.page, self.slot.context, self.tenant)
+
+        self.busy = True
+        started = time.monotonic()
+        try:
+            status = await self.supervisor.poll(attempt)
+        finally:
+            self.busy = False
+        self.last_duration = time.monotonic() - started
+        self.polls += 1
+        self.recent.append(started)
+        self.slot.net_stats.reset()
+
+        if status == supervisor.OK:
+            self.consecutive_errors = 0
+            self.last_success = time.time()
+        elif status == supervisor.FAILED:
+            self.errors += 1
+            self.consecutive_errors += 1
+        SHARD_POLLS.inc(shard=self.tenant.name, result=status)
+        return status
+
+    def health(self) -> dict:
+        now = time.monotonic()
+        while self.recent and now - self.recent[0] > self.RATE_WINDOW:
+            self.recent.popleft()
+        return {
+            "up": self.up,
+            "polls": self.polls,
+            "errors": self.errors,
+            "consecutive_errors": self.consecutive_errors,
+            "skipped_ticks": self.skipped,
+            "polls_per_minute": len(self.recent) * 60 / self.RATE_WINDOW,
+            "last_success": self.last_success,
+            "last_duration": self.last_duration,
+        }
+
+
+class ShardSet:
+
+    def __init__(self, lifecycle, tenant, page_slots, count=None):
+        self.lifecycle = lifecycle
+        self.tenant = tenant
+        self.page_slots = page_slots
+        self.shards = [Shard(i, tenant.shard(i)) for i in range(count or config.SHARDS)]
+        # set once the poll that claimed a seat is through with it (add submitted, mail queued)
+        self.concluded = False
+        registry[tenant.name] = self
+
+    async def run(self):
+        keepers = []
+        for shard in self.shards:
+            await shard.open(self.lifecycle)
+            SHARD_UP.set(1, shard=shard.tenant.name)
+            if config.KEEPALIVE:
+                keeper = keepalive.SessionKeeper(self.lifecycle.browser, shard.slot.context, shard.tenant)
+                shard.slot.on_open.append(lambda opened, keeper=keeper: keeper.rebind(opened.browser, opened.context))
+                keepers.append(asyncio.create_task(keeper.run()))
+
+        if config.AUTO_ENROLL:
+            # one add form for the account, on shard 0's context; any shard that sees a seat uses it
+            first = self.shards[0]
+            enroller = enroll.AutoEnroller(first.slot.context, first.tenant)
+            first.slot.on_open.append(lambda opened: enroller.rebind(opened.context))
+            # on the Account, so every shard's tenant has it
+            self.tenant.enroller = enroller
+            keepers.append(asyncio.create_task(enroller.keep_warm()))
+
+        polls = set()
+        tick = 0
+        try:
+            # not on claimed_vacancies, that would cancel the claiming poll in the middle of its add
+            while not self.concluded:
+                live = [shard for shard in self.shards if shard.up]
+                if not live:
+                    raise Exception(f"Every shard of {self.tenant.name} gave up.")
+
+                shard = live[tick % len(live)]
+                tick += 1
+                if shard.busy:
+                    # still on its last poll, this phase is lost
+                    shard.skipped += 1
+                else:
+                    task = asyncio.create_task(self._poll(shard))
+                    polls.add(task)
+                    task.add_done_callback(polls.discard)
+                    task.add_done_callback(lambda done, shard=shard: self._poll_done(shard, done))
+
+                # each shard waits a full interval between its own polls
+                await asyncio.sleep(self.tenant.scheduler.next_delay() / len(live))
+        finally:
+            for task in [*polls, *keepers]:
+                task.cancel()
+            for shard in self.shards:
+                if shard.slot is not None:
+                    await self.lifecycle.release(shard.slot)
+        print(f"[{self.tenant.name}] Vacancy handled, shards concluding")
+
+    async def _poll(self, shard):
+        status = await shard.poll(self.lifecycle, self.page_slots)
+        self.tenant.scheduler.record_poll(len(self.tenant.watchlist))
+        metrics.POLLS.inc(tenant=self.tenant.name)
+        if status == supervisor.OK:
+            self.tenant.scheduler.record_success()
+            metrics.LAST_SUCCESS.set(time.time(), tenant=self.tenant.name)
+            metrics.mark_startup("first_poll")
+        elif status == supervisor.VACANCY:
+            self.concluded = True
+        elif status == supervisor.FAILED:
+            # the shards share one account, the others would only take Duo closer to a lockout
+            print(f"[{shard.tenant.name}] Authentication gave up, stopping every shard of {self.tenant.name}")
+            for other in self.shards:
+                other.up = False
+                SHARD_UP.set(0, shard=other.tenant.name)
+
+    def _poll_done(self, shard, task):
+        """Nobody awaits a shard's poll task, an exception that got out of it stops the shard here."""
+        if task.cancelled() or task.exception() is None:
+            return
+        shard.up = False
+        SHARD_UP.set(0, shard=shard.tenant.name)
+        print(f"[{shard.tenant.name}] Poll raised {task.exception()!r}, shard stopped")
+
+    def health(self) -> dict:
+        return {shard.tenant.name: shard.health() for shard in self.shards}
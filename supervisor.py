@@ -0,0 +1,219 @@
+# supervisor.py
+# Keeps a tenant polling through failures instead of ending its run on the
+# first failed poll. A poll returns one of the outcomes below; for FAILED,
+# utils.handle_error has recorded what went wrong in the attempt, and the
+# Supervisor sorts it into one of four kinds and retries on the same page and
+# context with capped exponential backoff:
+#
+#   network   timeouts, dropped connections: retry as is
+#   selector  the page isn't what we expect (drift, maintenance page): retry
+#             from a cold navigate, a fresh page after SUPERVISOR_RECYCLE_AFTER
+#   session   sent back to CAS: retry, the cold path logs in again
+#   auth      CAS/Duo login failed: slow retries, the tenant gives up after
+#             SUPERVISOR_MAX_AUTH_FAILURES so Duo doesn't lock the account
+#
+# VACANCY concludes the tenant's run as before.
+# One circuit breaker is shared by every tenant: BREAKER_THRESHOLD failures
+# in a row (auth aside, that's per account) look like a GOLD outage, and all
+# polling pauses for BREAKER_COOLDOWN, then one probe goes out.
+
+import asyncio
+import random
+import time
+from contextvars import ContextVar
+import config
+import metrics
+
+NETWORK, SELECTOR, SESSION, AUTH = "network", "selector", "session", "auth"
+
+# what utils.check_class_status and HttpPoller.poll return
+OK, VACANCY, FAILED = "ok", "vacancy", "failed"
+
+FAILURES = metrics.Counter("scanner_poll_failures_total", "Failed poll attempts by kind")
+RECOVERY_SECONDS = metrics.Histogram(
+    "scanner_recovery_seconds", "Time from a tenant's first failed attempt to its next good poll, by the first failure's kind",
+    buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600))
+BREAKER_OPEN = metrics.Gauge("scanner_breaker_open", "1 while the circuit breaker holds polling back")
+
+# failures recorded during the current attempt, a list per Supervisor.poll() call
+_failures = ContextVar("supervisor_failures", default=None)
+
+# exception type names of timeouts and dropped connections, from playwright, httpx and asyncio
+NETWORK_ERRORS = ("TimeoutError", "TimeoutException", "ConnectError", "ReadError", "WriteError",
+                  "RemoteProtocolError", "ConnectTimeout", "ReadTimeout", "PoolTimeout", "ConnectionError")
+AUTH_CONTEXTS = ("login_cas", "duo_auth")
+SESSION_MARKERS = ("Redirected to CAS", "sessions are invalid", "needs a login")
+
+
+def record(context_message, exception):
+    """Note a handled failure for the Supervisor running this task, called by utils.handle_error."""
+    failures = _failures.get()
+    if failures is not None:
+        failures.append((context_message, exception))
+
+
+def classify(context_message, exception) -> str:
+    if any(name in context_message for name in AUTH_CONTEXTS):
+        # whatever broke, Duo may have seen a code, so it counts against the account
+        return AUTH
+    if type(exception).__name__ == "SessionExpired" or any(marker in str(exception) for marker in SESSION_MARKERS):
+        return SESSION
+    if type(exception).__name__ in NETWORK_ERRORS or isinstance(exception, OSError) or "net::ERR_" in str(exception):
+        return NETWORK
+    return SELECTOR
+
+
+class Breaker:
+    """Process-wide circuit breaker over poll attempts."""
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self):
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.cooldown = config.BREAKER_COOLDOWN
+        # half open: a single attempt is let through to see if GOLD is back
+        self.probing = False
+
+    def _open(self):
+        self.state = self.OPEN
+        self.opened_at = time.monotonic()
+        self.probing = False
+        BREAKER_OPEN.set(1)
+        print(f"Circuit breaker open after {self.failures} failures in a row, pausing polls for {self.cooldown:.0f} s")
+
+    def record_success(self):
+        if self.state != self.CLOSED:
+            print("Circuit breaker closed, GOLD is answering again")
+        self.state = self.CLOSED
+        self.failures = 0
+        self.cooldown = config.BREAKER_COOLDOWN
+        self.probing = False
+        BREAKER_OPEN.set(0)
+
+    def record_failure(self, kind):
+        if kind == AUTH:
+            return
+        self.failures += 1
+        if self.state == self.HALF_OPEN:
+            self.cooldown = min(config.BREAKER_COOLDOWN_MAX, self.cooldown * 2)
+            self._open()
+        elif self.state == self.CLOSED and self.failures >= config.BREAKER_THRESHOLD:
+            self._open()
+
+    def release(self):
+        """The probe ended without telling us anything (vacancy, auth, an exception), let another one go."""
+        self.probing = False
+
+    async def wait(self) -> bool:
+        """Return once an attempt may go out. True if that attempt is the half-open probe."""
+        while self.state != self.CLOSED:
+            if self.state == self.OPEN:
+                remaining = self.opened_at + self.cooldown - time.monotonic()
+                if remaining > 0:
+                    await asyncio.sleep(remaining)
+                    continue
+                self.state = self.HALF_OPEN
+            if not self.probing:
+                self.probing = True
+                return True
+            await asyncio.sleep(1)
+        return False
+
+    def health(self) -> dict:
+        return {"state": self.state, "failures_in_a_row": self.failures, "cooldown": self.cooldown}
+
+
+_breaker = None
+
+
+def breaker() -> Breaker:
+    global _breaker
+    if _breaker is None:
+        _breaker = Breaker()
+    return _breaker
+
+
+class Supervisor:
+    """Retries the poll attempts of one tenant (or shard) on its Slot."""
+
+    def __init__(self, tenant, slot=None):
+        self.tenant = tenant
+        self.slot = slot
+        self.streak = 0  # failed attempts since the last good one
+        self.auth_failures = 0
+        self.selector_failures = 0
+        # monotonic time and kind of the first failure of the streak, for RECOVERY_SECONDS
+        self.failing_since = None
+
+    def backoff(self) -> float:
+        delay = min(config.SUPERVISOR_BACKOFF_MAX, config.SUPERVISOR_BACKOFF_BASE * 2 ** (self.streak - 1))
+        if self.auth_failures:
+            # every retry is another CAS/Duo round
+            delay = max(delay, config.SUPERVISOR_AUTH_BACKOFF)
+        return delay * random.uniform(0.5, 1.0)
+
+    def _recovered(self):
+        if self.failing_since is not None:
+            started, kind = self.failing_since
+            took = time.monotonic() - started
+            RECOVERY_SECONDS.observe(took, kind=kind)
+            print(f"[{self.tenant.name}] Recovered from {kind} failure after {took:.1f} s and {self.streak} retries")
+        self.streak = self.auth_failures = self.selector_failures = 0
+        self.failing_since = None
+
+    async def poll(self, attempt) -> str:
+        """Run `attempt()` (an async poll returning OK, VACANCY or FAILED) until it doesn't fail.
+
+        Returns OK after a good poll, VACANCY when a seat was found, FAILED when auth keeps failing.
+        """
+        while True:
+            probe = await breaker().wait()
+            failures = []
+            token = _failures.set(failures)
+            try:
+                outcome = await attempt()
+            except BaseException:
+                if probe:
+                    # nobody would ever close or reopen the breaker otherwise
+                    breaker().release()
+                raise
+            finally:
+                _failures.reset(token)
+
+            if outcome == OK:
+                breaker().record_success()
+                self._recovered()
+                return OK
+            if outcome == VACANCY:
+                if probe:
+                    breaker().release()
+                return VACANCY
+
+            # the first failure is the cause, later ones are usually fallout from it
+            kind = classify(*failures[0]) if failures else SELECTOR
+            FAILURES.inc(kind=kind, tenant=self.tenant.name)
+            breaker().record_failure(kind)
+            if kind == AUTH and probe:
+                # says nothing about GOLD being up, let another tenant probe
+                breaker().release()
+            self.streak += 1
+            if self.failing_since is None:
+                self.failing_since = (time.monotonic(), kind)
+
+            if kind == AUTH:
+                self.auth_failures += 1
+                if self.auth_failures >= config.SUPERVISOR_MAX_AUTH_FAILURES:
+                    print(f"[{self.tenant.name}] Authentication failed {self.auth_failures} times in a row, giving up")
+                    return FAILED
+            elif kind == SELECTOR:
+                self.selector_failures += 1
+                if self.slot is not None and self.selector_failures % config.SUPERVISOR_RECYCLE_AFTER == 0:
+                    # a page stuck in a bad state, the context and its cookies stay
+                    print(f"[{self.tenant.name}] {self.selector_failures} unexpected pages in a row, recycling the page")
+                    await self.slot.recycle_page()
+
+            delay = self.backoff()
+            print(f"[{self.tenant.name}] Poll failed ({kind}), retry {self.streak} in {delay:.1f} s")
+            await asyncio.sleep(delay)
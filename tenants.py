@@ -0,0 +1,173 @@
+# tenants.py
+# Per-account state, so several students' watchlists can share one Chromium.
+# Each tenant gets its own BrowserContext (cookie jar) in main.run_script.
+
+import asyncio
+import os
+import time
+from collections import deque
+import config
+import history
+from scheduler import PollScheduler
+
+
+class Account:
+    """What a tenant and its shards share: one login, its counters and log, one poll schedule, one vacancy claim."""
+
+    def __init__(self):
+        # bounded so /health stays the same size however long we run
+        self.auth_log = deque(maxlen=config.AUTH_LOG_SIZE)
+        self.cas_auth_counter = 0
+        self.duo_auth_counter = 0
+        # one CAS/Duo login at a time per account, the keep-alive and the poll loop may both want one
+        self.auth_lock = asyncio.Lock()
+        self.scheduler = PollScheduler()
+        # enroll.AutoEnroller when AUTO_ENROLL is on
+        self.enroller = None
+        # sections already handled as vacant, so the first shard to see a seat wins
+        self.claimed_vacancies = set()
+        # catalog matches already mailed, kept apart: they don't end the run
+        self.catalog_notified = set()
+        # busy hours learned on earlier runs
+        self.scheduler.seed(history.store().change_times(since=time.time() - config.HISTORY_SEED_DAYS * 86400))
+
+
+class _Shared:
+    """A Tenant attribute that lives on its Account."""
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, tenant, owner=None):
+        return self if tenant is None else getattr(tenant.account, self.name)
+
+    def __set__(self, tenant, value):
+        setattr(tenant.account, self.name, value)
+
+
+class Tenant:
+    """Credentials, HOTP state, cookie jar and watchlist of one GOLD account."""
+
+    auth_log = _Shared()
+    cas_auth_counter = _Shared()
+    duo_auth_counter = _Shared()
+    auth_lock = _Shared()
+    scheduler = _Shared()
+    enroller = _Shared()
+    claimed_vacancies = _Shared()
+    catalog_notified = _Shared()
+
+    def __init__(self, name, username, passwd, hopt_key, hopt_counter, to_email, cookies_path, watchlist, env_prefix="",
+                 catalog=(), account=None):
+        self.name = name
+        # a shard passes its tenant's
+        self.account = account or Account()
+        # the account behind it, shards of one tenant share it (and its HOTP counter)
+        self.identity = name
+        self.username = username
+        self.passwd = passwd
+        self.hopt_key = hopt_key
+        # only seeds hotp_store the first time this tenant authenticates
+        self.hopt_counter = hopt_counter
+        self.to_email = to_email
+        self.cookies_path = cookies_path
+        self.watchlist = watchlist
+        # sections kept in watchlist.json but not polled, see watchlist.py
+        self.paused = frozenset()
+        # subject-wide queries, see catalog.py
+        self.catalog = list(catalog)
+        # watched courses polled at the governor's background priority
+        self.background_courses = frozenset()
+        # the .env keys of this tenant are prefixed, e.g. ALICE_HOPT_COUNTER
+        self.env_prefix = env_prefix
+
+        # unix times of the last completed CAS login and Duo authentication, per session (cookie jar)
+        self.authed_at = None
+        self.duo_authed_at = None
+        # made by shard(), they get watchlist changes too
+        self.shards = []
+
+    def claim_vacancy(self, section) -> bool:
+        """True for the first caller only, for a given section."""
+        if section in self.claimed_vacancies:
+            return False
+        self.claimed_vacancies.add(section)
+        return True
+
+    def shard(self, index):
+        """Same account and watchlist with its own cookie jar and login times, see shards.py. Shares the Account."""
+        cookies_path = self.cookies_path
+        if index:
+            # shard 0 keeps the tenant's own jar
+            root, ext = os.path.splitext(self.cookies_path)
+            cookies_path = f"{root}-shard{index}{ext}"
+        shard = Tenant(f"{self.name}#{index}", self.username, self.passwd, self.hopt_key, self.hopt_counter, self.to_email,
+                       cookies_path, self.watchlist, self.env_prefix, self.catalog, account=self.account)
+        shard.identity = self.identity
+        shard.paused = self.paused
+        shard.background_courses = self.background_courses
+        self.shards.append(shard)
+        return shard
+
+    def set_watchlist(self, watchlist, paused=(), catalog=(), background_courses=()):
+        """Swap in a new watchlist for this tenant and its shards. A poll already iterating the old one finishes on it."""
+        for tenant in [self, *self.shards]:
+            tenant.watchlist = watchlist
+            tenant.paused = frozenset(paused)
+            tenant.catalog = list(catalog)
+            tenant.background_courses = frozenset(background_courses)
+
+    def __repr__(self):
+        return f"Tenant({self.name!r})"
+
+    @classmethod
+    def from_env(cls, name, env_prefix, watchlist, to_email, cookies_path=None, catalog=()):
+        return cls(
+            name=name,
+            username=os.environ[f"{env_prefix}username"],
+            passwd=os.environ[f"{env_prefix}passwd"],
+            hopt_key=os.environ[f"{env_prefix}HOPT_KEY"],
+            hopt_counter=int(os.environ[f"{env_prefix}HOPT_COUNTER"]),
+            to_email=to_email,
+            cookies_path=cookies_path or f"cookies-{name}.json",
+            watchlist=watchlist,
+            env_prefix=env_prefix,
+            catalog=catalog,
+        )
+
+
+# name -> Tenant, read by the health server
+registry = {}
+
+
+def default() -> Tenant:
+    """The account configured at the top level of config.py and .env."""
+    if "default" not in registry:
+        registry["default"] = Tenant(
+            name="default",
+            username=config.username,
+            passwd=config.passwd,
+            hopt_key=config.HOPT_KEY,
+            hopt_counter=config.HOPT_COUNTER,
+            to_email=config.to_email,
+            cookies_path=config.cookies_path,
+            watchlist=config.WATCHLIST,
+            catalog=config.CATALOG,
+        )
+    return registry["default"]
+
+
+def load_all() -> list:
+    """The default account plus every account in config.TENANTS that has something to watch."""
+    default()
+    for name, entry in config.TENANTS.items():
+        if name not in registry:
+            registry[name] = Tenant.from_env(
+                name,
+                entry["env_prefix"],
+                entry["watchlist"],
+                entry.get("to_email", config.to_email),
+                entry.get("cookies_path"),
+                entry.get("catalog", []),
+            )
+    return [tenant for tenant in registry.values() if tenant.watchlist or tenant.catalog]
@@ -0,0 +1,114 @@
+# trace_report.py
+# Where the time goes across the cycles in traces.jsonl (see tracer.py):
+# cycle durations per kind, then per span name its count, latency
+# percentiles and self time (own time minus its children) as a share of all
+# traced cycle time, so navigation, postbacks, parsing and auth can be told apart.
+#
+#   python trace_report.py                      # TRACE_PATH from config.py
+#   python trace_report.py traces.jsonl.1 traces.jsonl --kind poll --since 24
+
+import argparse
+import json
+import math
+import time
+from collections import defaultdict
+
+
+def percentile(samples, p):
+    """Nearest-rank percentile of a sorted list."""
+    return samples[max(0, math.ceil(p / 100 * len(samples)) - 1)]
+
+
+def read_cycles(paths, tenant=None, kind=None, since=None):
+    for path in paths:
+        try:
+            f = open(path, 'r')
+        except FileNotFoundError:
+            continue
+        with f:
+            for line in f:
+                try:
+                    cycle = json.loads(line)
+                except ValueError:
+                    # a line cut short by a crash
+                    continue
+                if tenant and cycle["tenant"] != tenant:
+                    continue
+                if kind and cycle["kind"] != kind:
+                    continue
+                if since and cycle["start"] < since:
+                    continue
+                yield cycle
+
+
+def summarize(cycles) -> dict:
+    kinds = defaultdict(lambda: {"durations": [], "failed": 0})
+    spans = defaultdict(lambda: {"durations": [], "self": 0.0, "errors": 0})
+    total = 0.0
+
+    for cycle in cycles:
+        entry = kinds[cycle["kind"]]
+        entry["durations"].append(cycle["duration"])
+        entry["failed"] += not cycle["ok"]
+        total += cycle["duration"]
+
+        child_time = defaultdict(float)
+        for span in cycle["spans"]:
+            if span["parent"] is not None and span["duration"] is not None:
+                child_time[span["parent"]] += span["duration"]
+        for span in cycle["spans"]:
+            duration = span["duration"] if span["duration"] is not None else 0.0
+            # the root span is the cycle itself, its self time is what no step accounts for
+            name = span["name"] if span["parent"] is not None else f"({span['name']} untraced)"
+            stats = spans[name]
+            stats["durations"].append(duration)
+            stats["self"] += max(0.0, duration - child_time[span["id"]])
+            stats["errors"] += "error" in span["attrs"]
+
+    return {"kinds": kinds, "spans": spans, "total": total}
+
+
+def render(summary, top=None) -> str:
+    lines = []
+    lines.append(f"{'cycle kind':<24}{'count':>8}{'failed':>8}{'p50 s':>10}{'p95 s':>10}{'max s':>10}")
+    for kind, entry in sorted(summary["kinds"].items()):
+        durations = sorted(entry["durations"])
+        lines.append(f"{kind:<24}{len(durations):>8}{entry['failed']:>8}"
+                     f"{percentile(durations, 50):>10.3f}{percentile(durations, 95):>10.3f}{durations[-1]:>10.3f}")
+
+    lines.append("")
+    lines.append(f"{'span':<28}{'count':>8}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'self s':>10}{'share':>8}")
+    ranked = sorted(summary["spans"].items(), key=lambda item: item[1]["self"], reverse=True)
+    for name, stats in ranked[:top] if top else ranked:
+        durations = sorted(stats["durations"])
+        share = stats["self"] / summary["total"] if summary["total"] else 0.0
+        lines.append(f"{name:<28}{len(durations):>8}{stats['errors']:>8}"
+                     f"{percentile(durations, 50) * 1000:>10.1f}{percentile(durations, 95) * 1000:>10.1f}"
+                     f"{stats['self']:>10.3f}{share:>8.1%}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize traced cycles")
+    parser.add_argument('paths', nargs='*', help="JSONL files written by tracer.py (default: TRACE_PATH and its .1)")
+    parser.add_argument('--tenant')
+    parser.add_argument('--kind', help="poll, poll_http, refresh, enroll_warm")
+    parser.add_argument('--since', type=float, help="only cycles of the last N hours")
+    parser.add_argument('--top', type=int, help="only the N spans with the most self time")
+    args = parser.parse_args()
+
+    paths = args.paths
+    if not paths:
+        import config
+        paths = [config.TRACE_PATH + '.1', config.TRACE_PATH]
+    since = time.time() - args.since * 3600 if args.since else None
+
+    summary = summarize(read_cycles(paths, args.tenant, args.kind, since))
+    if not summary["kinds"]:
+        print("No traced cycles found.")
+        return
+    print(render(summary, args.top))
+
+
+if __name__ == '__main__':
+    main()
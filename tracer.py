@@ -0,0 +1,202 @@
+# tracer.py
+# Structured traces in place of the TRACE strings. A cycle (one poll, one
+# background refresh, ...) is a tree of spans with perf_counter offsets and
+# short events, kept in a bounded buffer. Error mails get it rendered as text,
+# and cycles that failed or took longer than TRACE_SLOW_SECONDS are appended
+# to TRACE_PATH as one JSON line, for trace_report.py.
+#
+#   with tracer.cycle(tenant, "poll"):
+#       with tracer.span("navigate", url=SEARCH_URL):
+#           ...
+#           tracer.event("redirected to CAS")
+#
+# The current cycle and span follow the asyncio task (contextvars), so tenants
+# and shards polling at the same time each get their own trace.
+
+import json
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+import config
+
+# (Cycle, Span) of the running task, None outside a cycle
+_current = ContextVar("tracer_current", default=None)
+
+
+class Span:
+
+    __slots__ = ("id", "parent", "name", "start", "duration", "attrs", "events")
+
+    def __init__(self, id, parent, name, start, attrs):
+        self.id = id
+        self.parent = parent
+        self.name = name
+        self.start = start
+        self.duration = None
+        self.attrs = attrs
+        self.events = []
+
+    def to_dict(self, origin) -> dict:
+        return {
+            "id": self.id,
+            "parent": self.parent,
+            "name": self.name,
+            "start": round(self.start - origin, 6),
+            "duration": None if self.duration is None else round(self.duration, 6),
+            "attrs": self.attrs,
+            "events": [[round(at - origin, 6), message] for at, message in self.events],
+        }
+
+
+class Cycle:
+
+    def __init__(self, tenant, kind):
+        self.tenant = tenant
+        self.kind = kind
+        self.wall_start = time.time()
+        self.origin = time.perf_counter()
+        self.root = Span(0, None, kind, self.origin, {})
+        self.spans = [self.root]
+        # spans + events, capped at TRACE_MAX_ITEMS so a runaway loop can't grow the buffer
+        self.items = 0
+        self.dropped = 0
+        self.error = None
+
+    def _room(self) -> bool:
+        if self.items >= config.TRACE_MAX_ITEMS:
+            self.dropped += 1
+            return False
+        self.items += 1
+        return True
+
+    def open(self, parent, name, attrs):
+        if not self._room():
+            # still timed by the caller, just not kept; children attach to the parent
+            return None
+        span = Span(len(self.spans), parent.id, name, time.perf_counter(), attrs)
+        self.spans.append(span)
+        return span
+
+    def event(self, span, message):
+        if self._room():
+            span.events.append((time.perf_counter(), message))
+
+    @property
+    def duration(self):
+        return self.root.duration if self.root.duration is not None else time.perf_counter() - self.origin
+
+    def to_dict(self) -> dict:
+        return {
+            "tenant": self.tenant.name if self.tenant is not None else None,
+            "kind": self.kind,
+            "start": self.wall_start,
+            "duration": round(self.duration, 6),
+            "ok": self.error is None,
+            "error": self.error,
+            "dropped": self.dropped,
+            "spans": [span.to_dict(self.origin) for span in self.spans],
+        }
+
+    def text(self) -> str:
+        """Indented, human readable form for error mails."""
+        children = {}
+        for span in self.spans[1:]:
+            children.setdefault(span.parent, []).append(span)
+        lines = []
+
+        def walk(span, depth):
+            took = "running" if span.duration is None else f"{span.duration * 1000:.0f} ms"
+            attrs = " ".join(f"{key}={value}" for key, value in span.attrs.items())
+            lines.append(f"{'  ' * depth}+{(span.start - self.origin) * 1000:.0f} ms {span.name} ({took}) {attrs}".rstrip())
+            # events and child spans in the order they happened
+            steps = [(at, message) for at, message in span.events] + [(child.start, child) for child in children.get(span.id, [])]
+            for at, step in sorted(steps, key=lambda step: step[0]):
+                if isinstance(step, Span):
+                    walk(step, depth + 1)
+                else:
+                    lines.append(f"{'  ' * (depth + 1)}+{(at - self.origin) * 1000:.0f} ms {step}")
+
+        walk(self.root, 0)
+        if self.dropped:
+            lines.append(f"({self.dropped} spans/events dropped)")
+        return "\n".join(lines)
+
+
+def _export(cycle):
+    mode = config.TRACE_EXPORT
+    if mode == "off":
+        return
+    if mode != "all" and cycle.error is None and cycle.duration < config.TRACE_SLOW_SECONDS:
+        return
+    try:
+        if os.path.exists(config.TRACE_PATH) and os.path.getsize(config.TRACE_PATH) > config.TRACE_MAX_BYTES:
+            # one old generation is kept
+            os.replace(config.TRACE_PATH, config.TRACE_PATH + '.1')
+        with open(config.TRACE_PATH, 'a') as f:
+            f.write(json.dumps(cycle.to_dict()) + "\n")
+    except OSError as e:
+        print(f"Could not write trace: {e}")
+
+
+@contextmanager
+def cycle(tenant, kind):
+    """Trace one poll/refresh/... of `tenant`. Inside a running cycle this is just a span."""
+    if _current.get() is not None:
+        with span(kind):
+            yield
+        return
+    current = Cycle(tenant, kind)
+    token = _current.set((current, current.root))
+    try:
+        yield current
+    except BaseException as e:
+        current.error = current.error or repr(e)
+        raise
+    finally:
+        current.root.duration = time.perf_counter() - current.origin
+        _current.reset(token)
+        _export(current)
+
+
+@contextmanager
+def span(name, **attrs):
+    """Time a block as a child of the current span. Does nothing outside a cycle."""
+    current = _current.get()
+    if current is None:
+        yield None
+        return
+    cycle_, parent = current
+    opened = cycle_.open(parent, name, attrs)
+    if opened is None:
+        yield None
+        return
+    token = _current.set((cycle_, opened))
+    try:
+        yield opened
+    except BaseException as e:
+        opened.attrs["error"] = type(e).__name__
+        raise
+    finally:
+        opened.duration = time.perf_counter() - opened.start
+        _current.reset(token)
+
+
+def event(message):
+    """Note a step in the current span, the TRACE += of old."""
+    current = _current.get()
+    if current is not None:
+        current[0].event(current[1], message)
+
+
+def fail(exception):
+    """Mark the current cycle failed, so it is exported even though the exception was handled."""
+    current = _current.get()
+    if current is not None:
+        current[0].error = current[0].error or repr(exception)
+
+
+def text() -> str:
+    """The current cycle so far, rendered for an error mail."""
+    current = _current.get()
+    return current[0].text() if current is not None else "---no trace---"
@@ -1,232 +1,242 @@
 import config
+import capture
+import cookie_store
+import governor
+import history
+import hotp_store
+import metrics
+import session
+import supervisor
+import tracer
 import asyncio
-import json
-import os
+import time
 import traceback
-import uvicorn
-from health_server import app
+from contextlib import contextmanager
+from contextvars import ContextVar
 from datetime import datetime
-from emailsender import send_email
+import notifier
+from results_parser import extract_rows, find_sections
 from dotenv import load_dotenv
-import pyotp
 
 config.start_time = datetime.now()
+
+# True inside background() (keepalive.py refreshes): their logins and errors don't slow the poll loop
+_background = ContextVar("background_auth", default=False)
+
+
+@contextmanager
+def background():
+    token = _background.set(True)
+    try:
+        yield
+    finally:
+        _background.reset(token)
+
     
-if not os.path.exists('./screenshots'):
-    os.makedirs('./screenshots')
-    
-async def handle_error(context_message, exception, stringtrace="---no string trace---"):
-    """Handle errors by logging traceback and sending an email."""
-    error_trace = traceback.format_exc()
-    full_message = f"{context_message}\nException: {str(exception)}\nTraceback: \n{error_trace}\n Authentication log:\n{config.auth_log} Stringtrace: \n\n {stringtrace}"
-    print(full_message, stringtrace)
-    await asyncio.to_thread(send_email, f"Error in GOLD Class Monitor Script", full_message, config.to_email)
+async def handle_error(context_message, exception, stringtrace="", tenant=None, poll=True):
+    """Handle errors by logging traceback and sending an email. The current trace is included, `stringtrace` is extra notes.
 
-async def load_cookies(context) -> bool:
-    """Load cookies from a JSON file and set them in the browser context."""
+    `poll=False` for failures that are not the poll's (a failed auto-add), the supervisor doesn't retry those.
+    Inside background() every error counts as poll=False.
+    """
+    poll = poll and not _background.get()
+    error_trace = traceback.format_exc()
+    auth_log = tenant.auth_log if tenant else []
+    to_email = tenant.to_email if tenant else config.to_email
+    name = f" [{tenant.name}]" if tenant else ""
+    metrics.ERRORS.inc(tenant=tenant.name if tenant else "")
+    if tenant and poll:
+        tenant.scheduler.record_error()
+    # a handled error still marks the cycle failed, so its trace is exported
+    tracer.fail(exception)
+    if poll:
+        # and tells the supervisor what kind of retry the poll needs
+        supervisor.record(context_message, exception)
+    # the snapshots of this cycle only hit the disk now
+    capture_dir = await capture.flush(tenant)
+    full_message = f"{context_message}{name}\nException: {str(exception)}\nTraceback: \n{error_trace}\n Authentication log:\n{list(auth_log)} Page captures: {capture_dir}\n Trace: \n\n{tracer.text()}\n{stringtrace}"
+    print(full_message)
+    # repeats of the same failure are folded into a digest instead of one mail each
+    notifier.get().error(f"{context_message}{name}: {type(exception).__name__}", f"Error in GOLD Class Monitor Script", full_message, to_email)
+
+async def load_cookies(context, tenant) -> bool:
+    """Set the tenant's saved cookies (read once per run, expired ones dropped) in the browser context."""
     try:
-        if os.path.exists(config.cookies_path):
-            with open(config.cookies_path, 'r') as cookies_file:
-                cookies = json.load(cookies_file)
-                await context.add_cookies(cookies)
-            # print(f"Cookies loaded from {cookies_path}")
+        cookies = await cookie_store.load(tenant)
+        if cookies:
+            await context.add_cookies(cookies)
     except Exception as e:
-        await handle_error("Error in load_cookies", e, "")
+        await handle_error("Error in load_cookies", e, "", tenant)
         return False
 
     return True
 
-def update_env_variable(key, value):
-    """Update the specified environment variable in the .env file."""
-    env_file_path = '.env'
-    with open(env_file_path, 'r') as file:
-        lines = file.readlines()
-
-    with open(env_file_path, 'w') as file:
-        for line in lines:
-            if line.startswith(f"{key}="):
-                # Update the value of the key
-                file.write(f"{key}={value}\n")
-            else:
-                file.write(line)
-
-    # Update the dotenv module
-    load_dotenv(override=True)
-
-
-async def save_cookies(context) -> bool:
-    """Save cookies to a JSON file."""
+async def save_cookies(context, tenant) -> bool:
+    """Save the context's cookies to the tenant's jar, atomically and only if they changed."""
     try:
-        cookies = await context.cookies()
-        with open(config.cookies_path, 'w') as cookies_file:
-            json.dump(cookies, cookies_file)
-        # print(f"Cookies saved to {cookies_path}")
+        if await cookie_store.save(tenant, await context.cookies()):
+            tracer.event(f"Cookies saved to {tenant.cookies_path}")
     except Exception as e:
-        await handle_error("Error in save_cookies", e, "")
+        await handle_error("Error in save_cookies", e, "", tenant)
         return False
 
     return True
 
 
-async def check_class_status(page, context) -> bool:
-    TRACE = ""
-    try:
-        await page.goto('https://my.sa.ucsb.edu/gold/BasicFindCourses.aspx', wait_until='domcontentloaded')
-        # screenshot
-        # print("Attempting to access GOLD, page navigated")
-        TRACE += "Attempting to access GOLD, page navigated"
-
-        await page.screenshot(path='./screenshots/step-3-gold.png')
-
-        # Check if we're at the CAS login page (State S1)
-        if 'sso.ucsb.edu/cas/login' in page.url:
-            # print("Attempting Authentication, CAS Not Authenticated: URL: ", page.url)
-            TRACE += "Attempting Authentication, CAS Not Authenticated: URL: " + page.url
-            await page.screenshot(path='./screenshots/step-0-auth-possible.png')
-            if not await login_cas(page, context):
-                return False  # was not able to login at all
-            #save cookies
-            if not await save_cookies(context):
-                raise Exception("Cookies did not fit in jar.")
-            # print("Attempting to access GOLD, page navigated - checking against to see if at CAS login")
-            TRACE += "Attempting to access GOLD, page navigated - checking against to see if at CAS login"
-            await page.screenshot(path='./screenshots/step-4-gold.png')
-
-        # Go to GOLD page again
-        await page.goto('https://my.sa.ucsb.edu/gold/BasicFindCourses.aspx', wait_until='domcontentloaded')
-        # screenshot
+async def check_class_status(page, context, tenant) -> str:
+    """One poll over the tenant's watchlist: supervisor.OK, VACANCY (a seat was found) or FAILED (error handled)."""
+    with tracer.cycle(tenant, "poll"):
+        return await _check_class_status(page, context, tenant)
 
-        # Check if we were redirected to the CAS login page
-        # if that's the case then we're hopeless since the auth function failed
-        # but still returned true somehow
-        if 'sso.ucsb.edu/cas/login' in page.url:
-            # print("Both GOLD and CAS sessions are invalid.")
-            print("Reauthentication Failure: Both GOLD and CAS sessions are invalid")
-            raise Exception("Both GOLD and CAS sessions are invalid, and reauthentication failed.")
-        
-        TRACE += "Valid Session, continuing main logic."
 
-        await page.screenshot(path='./screenshots/step-5-gold.png')
-        # print("Attempting to access GOLD, performing scan")
-        TRACE += "Attempting to access GOLD, performing scan"
+async def _check_class_status(page, context, tenant) -> str:
+    capture.new_cycle(tenant)
+    # the page stays warm between polls, see session.py
+    gold = session.session_for(page, context, tenant)
+    try:
+        # One search per course, every watched section is read off its result page
+        for course, sections in tenant.watchlist.items():
+            with tracer.span("course", course=course_name(course), session=gold.state), \
+                    governor.priority(governor.section_priority(tenant, course)):
+                if not await gold.search(course):
+                    return supervisor.FAILED  # was not able to login at all
 
-        # Search for the class using provided payloads
-        await page.select_option('select[name="ctl00$pageContent$quarterDropDown"]', config.payload['ctl00$pageContent$quarterDropDown'])
-        await page.select_option('select[name="ctl00$pageContent$subjectAreaDropDown"]', config.payload['ctl00$pageContent$subjectAreaDropDown'])
-        await page.fill('input[name="ctl00$pageContent$courseNumberTextBox"]', config.payload['ctl00$pageContent$courseNumberTextBox'])
-        await page.click('input[name="ctl00$pageContent$searchButton"]')
-        await page.wait_for_load_state('networkidle')
+                # Parse and extract the desired information
+                outcome = await parse_and_process(page, course, sections, tenant)
+                if outcome != supervisor.OK:
+                    gold.reset()
+                    return outcome
 
-        # Parse and extract the desired information
-        return await parse_and_process(page)
+        return supervisor.OK
 
     except Exception as e:
-        await handle_error("Error in check_class_status", e, TRACE)
-        return False
+        # start the next poll from a full navigate
+        gold.reset()
+        await handle_error("Error in check_class_status", e, "", tenant)
+        return supervisor.FAILED
 
-async def parse_and_process(page):
-    TRACE = ""
+async def parse_and_process(page, course, sections, tenant) -> str:
+    """Read every result row in one evaluate and check the watched sections of `course`."""
     try:
-        # Step 1: Locate the class row
-        TRACE += "Finding class selector.\n"
-        class_row_selector = f'div[data-target*="{config.TARGET_CLASS_NUMBER}"]'
-        await page.wait_for_selector(class_row_selector, timeout=10000)
-        class_row = await page.query_selector(class_row_selector)
-
-        if class_row:
-            # Step 2: Extract class status
-            TRACE += "Class row found.\nExtracting class status.\n"
-            status_selector = '.col-lg-search-space.col-md-space.col-sm-push-1.col-sm-space.col-xs-2'
-            space_element = await class_row.query_selector(status_selector)
-
-            if space_element:
-                class_status = await space_element.inner_text()
-                class_status = class_status.strip()
-
-                # Step 3: Extract maximum seats available and append it to class_status
-                TRACE += "Extracting maximum seats.\n"
-                max_selector = '.col-lg-days.col-md-space.col-sm-push-1.col-sm-space.col-xs-2'
-                max_element = await class_row.query_selector(max_selector)
-                max_seats = None
-
-                if max_element:
-                    max_seats = await max_element.inner_text()
-                    max_seats = max_seats.strip()
-                    class_status = f"{config.payload_classname} | {class_status} | {max_seats} | Section: {config.TARGET_CLASS_NUMBER}"
-
-                TRACE += f"Class status updated: {class_status}.\n"
-
-                print(f"{datetime.now()}: {class_status}")
-
-                # Step 4: Determine if the class is available
-                if "Full" not in class_status:
-                    print("Class has vancancy!")
-                    TRACE += "Class is no longer full! Sending notification email.\n"
-                    email_message = f"The class is no longer full! Check GOLD to register IMMEDIATELY.\nStatus: {class_status}"
-                    await asyncio.to_thread(send_email, f"URGENT: {config.payload_classname} HAS VACANCY", email_message, config.to_email)
-                    return False  # returns twice, and breaks the main loop
-                else:
-                    TRACE += "Class is still full.\n"
-            else:
-                # print("Could not find class status information.")
-                raise Exception("Could not find class status information.")
-        else:
-            # print("Could not find the target class information.")
-            raise Exception("Could not find the target class information.")
+        with metrics.stage("parse"):
+            rows = await extract_rows(page)
+        tracer.event(f"Extracted {len(rows)} rows")
 
-    except Exception as e:
-        await handle_error("Error in parse_and_process", e, TRACE)
-        return False
+        return await process_statuses(course, sections, rows, tenant)
 
-    return True
+    except Exception as e:
+        await handle_error("Error in parse_and_process", e, "", tenant)
+        return supervisor.FAILED
+
+
+async def process_statuses(course, sections, rows, tenant) -> str:
+    """Check the watched sections among a result page's SectionRows; supervisor.VACANCY once one has a seat."""
+    detected_at = time.perf_counter()
+    name = course_name(course)
+    seats = history.store()
+    # a watchlist edit changes the sections to decide on, the same rows need a fresh look then
+    page_key = (tenant.name, course, tuple(sorted(sections)))
+    digest = seats.page_changed(page_key, rows)
+    if digest is None:
+        # same rows as last poll, nothing new to record or decide
+        print(f"{datetime.now()}: [{tenant.name}] {name} | unchanged")
+        return supervisor.OK
+
+    watched = find_sections(rows, sections)
+    # every section on the page goes into the history, its churn drives the poll interval
+    for row, previous in seats.record(rows):
+        if previous is not None:
+            tenant.scheduler.record_change(datetime.now())
+
+    for row in watched.values():
+        print(f"{datetime.now()}: [{tenant.name}] {name} | {row}")
+
+    # Step 4: Determine if the class is available
+    # when several sessions poll the same watchlist only the first to see a seat acts on it
+    vacant = [row for row in watched.values() if row.has_vacancy and tenant.claim_vacancy(row.section)]
+    if vacant:
+        metrics.VACANCIES.inc(len(vacant), tenant=tenant.name)
+        print("Class has vancancy!")
+        status_lines = "\n".join(f"{name} | {row}" for row in vacant)
+        email_message = f"The class is no longer full! Check GOLD to register IMMEDIATELY.\nStatus:\n{status_lines}"
+        if tenant.enroller is not None:
+            email_message += "\nAuto-add is being submitted, its result follows in a second mail."
+        # only queued, the urgent worker sends it while the add goes out
+        notifier.get().vacancy(f"URGENT: {name} HAS VACANCY", email_message, tenant.to_email)
+        if tenant.enroller is not None:
+            results, failed = [], False
+            for row in vacant:
+                added = await tenant.enroller.enroll(row, detected_at)
+                failed = failed or not added
+                results.append(f"Auto-add of section {row.section}: {'submitted and confirmed' if added else 'FAILED, add it manually'}")
+            notifier.get().vacancy(f"{name} auto-add {'FAILED' if failed else 'done'}", "\n".join(results), tenant.to_email)
+        seats.page_processed(page_key, digest)
+        return supervisor.VACANCY  # returns twice, and ends the main loop
+
+    seats.page_processed(page_key, digest)
+    return supervisor.OK
+
+
+def course_payload(course) -> dict:
+    """Fill the config.payload search form template for a (quarter, subject, course number) key."""
+    quarter, subject, number = course
+    payload = dict(config.payload)
+    payload["ctl00$pageContent$quarterDropDown"] = quarter
+    payload["ctl00$pageContent$subjectAreaDropDown"] = subject
+    payload["ctl00$pageContent$courseNumberTextBox"] = number
+    return payload
+
+
+def course_name(course) -> str:
+    return f"{course[1]} {course[2]}"
 
 
 # Function for: On Fatal Error, Send Email with all the information
 async def errorhandler_email():
     subject = f"GOLD Class Monitor Script has ended"
-    await asyncio.to_thread(send_email, subject, config.email_message, config.to_email)
+    notifier.get().message(subject, config.email_message, config.to_email)
 
 
-async def duo_auth_hopt(page, context) -> bool:
-    config.duo_auth_counter += 1
+async def duo_auth_hopt(page, context, tenant) -> bool:
+    tenant.duo_auth_counter += 1
+    metrics.REAUTHS.inc(kind="duo", tenant=tenant.name)
     #append current date and time to AUTH_LOG
-    config.auth_log.append(f"DUO Auth Counter: {config.duo_auth_counter} at {datetime.now()}")
-    TRACE = ""
+    tenant.auth_log.append(f"DUO Auth Counter: {tenant.duo_auth_counter} at {datetime.now()}")
     print("Attempting to authenticate with DUO with extracted HOPT key and counter")
-    TRACE += "Attempting to authenticate with DUO with extracted HOPT key and counter\n"
+    tracer.event("Attempting to authenticate with DUO with extracted HOPT key and counter")
     try:
 
-        await page.screenshot(path='./screenshots/duo-hopt-auth-0.png')
+        await capture.snap(page, 'duo-hopt-auth-0', tenant)
 
-        TRACE += "Locating iframe\n"
+        tracer.event("Locating iframe")
         duo_iframe_element = await page.wait_for_selector('iframe[id="duo_iframe"]', timeout=5000)
         # print("Found iframe, selecting frame")
-        TRACE += "Found iframe, selecting iframe\n"
+        tracer.event("Found iframe, selecting iframe")
         duo_frame = await duo_iframe_element.content_frame()
         await duo_frame.wait_for_load_state('domcontentloaded')
 
-        await duo_frame.page.screenshot(path='./screenshots/duo-hopt-auth-1.png')
+        await capture.snap(duo_frame, 'duo-hopt-auth-1', tenant)
         # Device selection
-        TRACE += "Selecting device\n"
+        tracer.event("Selecting device")
         device_select_locator = '#login-form > fieldset > div > select[name="device"]'
         await duo_frame.wait_for_selector(device_select_locator, state='visible', timeout=5000)
         await duo_frame.select_option(selector=device_select_locator, value="phone2")
 
-        await duo_frame.page.screenshot(path='./screenshots/duo-hopt-auth-2.png')
+        await capture.snap(duo_frame, 'duo-hopt-auth-2', tenant)
         # Check "remember for 10 hours"
-        TRACE += "Checking remember for 10 hours\n"
+        tracer.event("Checking remember for 10 hours")
         remember_checkbox_locator = '#login-form input[name="dampen_choice"]'
         await duo_frame.wait_for_selector(remember_checkbox_locator, state='visible', timeout=5000)
         await duo_frame.check(selector=remember_checkbox_locator)
 
-        await duo_frame.page.screenshot(path='./screenshots/duo-hopt-auth-3.png')
-        TRACE += "Locating target fieldset\n"
+        await capture.snap(duo_frame, 'duo-hopt-auth-3', tenant)
+        tracer.event("Locating target fieldset")
         fieldset_locator = 'fieldset[data-device-index="phone2"]'
         await duo_frame.wait_for_selector(fieldset_locator, state='visible', timeout=5000)
         fieldset = await duo_frame.query_selector(fieldset_locator)
 
-        await duo_frame.page.screenshot(path='./screenshots/duo-hopt-auth-4.png')
-        TRACE += "Locating passcode field button toggle\n"
+        await capture.snap(duo_frame, 'duo-hopt-auth-4', tenant)
+        tracer.event("Locating passcode field button toggle")
         enter_passcode_button_locator = 'button#passcode.positive.auth-button'
         enter_passcode_button = await fieldset.query_selector(enter_passcode_button_locator)
         if enter_passcode_button:
@@ -235,57 +245,57 @@ async def duo_auth_hopt(page, context) -> bool:
             #raise exception
             raise Exception("Could not find the enter passcode button.")
 
-        await duo_frame.page.screenshot(path='./screenshots/duo-hopt-auth-5.png')
-        TRACE += "Locating passcode input field\n"
+        await capture.snap(duo_frame, 'duo-hopt-auth-5', tenant)
+        tracer.event("Locating passcode input field")
         passcode_input_locator = 'div.passcode-input-wrapper input[name="passcode"]'
         passcode_input = await fieldset.query_selector(passcode_input_locator)
         if not passcode_input:
             raise Exception("Passcode input field not found.")
 
-        await duo_frame.page.screenshot(path='./screenshots/duo-hopt-auth-6.png')
+        await capture.snap(duo_frame, 'duo-hopt-auth-6', tenant)
         # Generate HOTP code
-        TRACE += "Generating HOTP code\n"
-        hotp = pyotp.HOTP(config.HOPT_KEY)
-
-        # Referencing nonexistent variable here apparently for some reason so
-        # this is a quick fix
-
-        hotp_code = hotp.at(config.HOPT_COUNTER)
-        TRACE += f"Generated HOTP code: {hotp_code}, at counter= {config.HOPT_COUNTER}\n"
+        tracer.event("Generating HOTP code")
+        import pyotp  # only needed when Duo actually asks
+        hotp = pyotp.HOTP(tenant.hopt_key)
+
+        # wait for the budget before the counter is taken, not while holding it
+        await governor.acquire(tenant)
+        # the counter is persisted as used before the code exists, see hotp_store.py
+        hotp_counter = await hotp_store.reserve(tenant)
+        hotp_code = hotp.at(hotp_counter)
+        tracer.event(f"Generated HOTP code at counter {hotp_counter}")
         print(f"Generated HOTP code: {hotp_code}, filling form")
-        TRACE += "Filling passcode input field\n"
-        await passcode_input.fill(hotp_code)
-
-        # if program fails here, HOPT_COUNTER is not incremented which is good
-        # no update is sent to the server and their counter is still in sync
-
-        TRACE += "Incrementing HOPT counter and saving to environment\n"
-        config.HOPT_COUNTER = config.HOPT_COUNTER+1
-        update_env_variable("HOPT_COUNTER", config.HOPT_COUNTER)
+        tracer.event("Filling passcode input field")
+        try:
+            await passcode_input.fill(hotp_code)
+
+            await capture.snap(duo_frame, 'duo-hopt-auth-7', tenant)
+            tracer.event("Locating login button")
+            login_button_locator = 'button#passcode.positive.auth-button'
+            login_button = await fieldset.query_selector(login_button_locator)
+            if not login_button:
+                raise Exception("Could not find the login button.")
+            await login_button.click()
+            tracer.event("Clicked login button")
+        except Exception as e:
+            # the code never reached Duo, their counter is still in sync with ours
+            await hotp_store.rollback(tenant, hotp_counter)
+            raise Exception("Could not submit the passcode.", e)
 
-        await duo_frame.page.screenshot(path='./screenshots/duo-hopt-auth-7.png')
-        TRACE += "Locating login button\n"
-        login_button_locator = 'button#passcode.positive.auth-button'
-        login_button = await fieldset.query_selector(login_button_locator)
-        if login_button:
-            try:
-                await login_button.click()
-                TRACE += "Clicked login button\n"
-            except Exception as e:
-                update_env_variable("HOPT_COUNTER", config.HOPT_COUNTER-1)
-                raise Exception("Could not click the login button.", e)
+        # submitted, from here on Duo may have counted it whatever happens next
+        await hotp_store.commit(tenant, hotp_counter)
 
-        await duo_frame.page.screenshot(path='./screenshots/duo-hopt-auth-8.png')
+        await capture.snap(duo_frame, 'duo-hopt-auth-8', tenant)
         # wait for page to settle
         await duo_frame.wait_for_load_state('domcontentloaded')
         # screenshot
         # print("Attempting to login CAS, page navigated")
-        await page.screenshot(path='./screenshots/step-5-duo-auth.png')
+        await capture.snap(page, 'step-5-duo-auth', tenant)
 
         # don't proceed until duo_frame closes
         await page.wait_for_load_state('domcontentloaded')
 
-        await page.screenshot(path='./screenshots/duo-hopt-auth-9.png')
+        await capture.snap(page, 'duo-hopt-auth-9', tenant)
 
         # need to implement checking the website to see if its still CAS
         
@@ -294,26 +304,26 @@ async def duo_auth_hopt(page, context) -> bool:
         try:
             await page.wait_for_selector('iframe#duo_iframe', state='detached', timeout=10000)
             print("Duo iframe has closed. Likely authenticated.")
-            TRACE += "DUO authentication successful\n"
         except Exception as e:
             raise Exception("HOPT Authentication failed: Duo iframe did not disappear 10 seconds after auth. Likely failed.",e)
 
 
-        TRACE += "DUO authentication successful\n"
+        tracer.event("DUO authentication successful")
         print("DUO CAS HOPT authentication successful")
+        tenant.duo_authed_at = time.time()
         # Save cookies
-        if not await save_cookies(context):
+        if not await save_cookies(context, tenant):
             raise Exception(
                 "Cookies did not fit in jar. Abandoning ship!!! Klingons Attacking Lower Decks!!! Also, Cowbows in Black Hats.")
     except Exception as e:
-        await handle_error("Error in duo_auth", e, TRACE)
+        await handle_error("Error in duo_auth", e, "", tenant)
         return False
 
     #save cookies
     return True
 
 
-async def duo_auth_push(page, context) -> bool:
+async def duo_auth_push(page, context, tenant) -> bool:
     try:
         duo_iframe_element = await page.wait_for_selector('iframe[id="duo_iframe"]', timeout=5000)
         # print("Found iframe, selecting frame")
@@ -333,13 +343,14 @@ async def duo_auth_push(page, context) -> bool:
         # Click "Send Me a Push"
         send_push_button_locator = '#login-form button.auth-button[type="submit"]'
         await duo_frame.wait_for_selector(send_push_button_locator, state='visible', timeout=5000)
+        await governor.acquire(tenant)
         await duo_frame.click(selector=send_push_button_locator)
 
         # wait for page to settle
         await duo_frame.wait_for_load_state('domcontentloaded')
         # screenshot
         # print("Attempting to login CAS, page navigated")
-        await duo_frame.page.screenshot(path='./screenshots/step-5-duo-auth.png')
+        await capture.snap(duo_frame, 'step-5-duo-auth', tenant)
 
         # don't proceed until duo_frame closes
         await duo_frame.wait_for_load_state('networkidle')
@@ -347,29 +358,35 @@ async def duo_auth_push(page, context) -> bool:
         # Save cookies, this can be a critical point.
         # we don't want to keep reauthenticating DUO.
         # its suspicious and can lead to account lockout
-        if not await save_cookies(context):
+        if not await save_cookies(context, tenant):
             raise Exception("Cookies did not fit in jar.")
 
     except Exception as e:
-        await handle_error("Error in duo_auth", e, "")
+        await handle_error("Error in duo_auth", e, "", tenant)
         return False
 
     return True
 
 
-async def login_cas(page, context) -> bool:
-    config.cas_auth_counter += 1
-    config.auth_log.append(f"CAS Auth Counter: {config.cas_auth_counter} at {datetime.now()}")
+async def login_cas(page, context, tenant) -> bool:
+    tenant.cas_auth_counter += 1
+    metrics.REAUTHS.inc(kind="cas", tenant=tenant.name)
+    if not _background.get():
+        # a keep-alive refresh is there so the polls don't notice the login
+        tenant.scheduler.record_reauth()
+    tenant.auth_log.append(f"CAS Auth Counter: {tenant.cas_auth_counter} at {datetime.now()}")
     try:
         # screenshot
         print("Reauthentication Required, attempting to login CAS")
-        await page.screenshot(path='./screenshots/step-1-cas-login.png')
+        await capture.snap(page, 'step-1-cas-login', tenant)
 
-        await page.goto('https://my.sa.ucsb.edu/gold/BasicFindCourses.aspx', wait_until='domcontentloaded')
+        await governor.acquire(tenant)
+        with metrics.stage("navigate"):
+            await page.goto(config.GOLD_URL + '/BasicFindCourses.aspx', wait_until='domcontentloaded')
 
         # screenshot
         # print("Attempting to login CAS, page navigated")
-        await page.screenshot(path='./screenshots/step-2-cas-login.png')
+        await capture.snap(page, 'step-2-cas-login', tenant)
 
         # print(await page.title())
         if "Login Successful" in await page.title():
@@ -377,21 +394,23 @@ async def login_cas(page, context) -> bool:
             return True
         elif "Duo" in await page.title():  
         # We do this in case we're CAS authed but not DUO authed
-            return await duo_auth_hopt(page, context)
+            with metrics.stage("duo_hotp"):
+                return await duo_auth_hopt(page, context, tenant)
         # f no redirects then we land at title = "Login Successful - UCSB Authentication Service"
         elif "Log In" in await page.title():
             #We are not CAS authed
             
             # print("Logging in with credentials...")
+            cas_started = time.perf_counter()
             #wait for elements to load
             await page.wait_for_selector('input#username', state='attached')
-            await page.fill('input#username', config.username)
+            await page.fill('input#username', tenant.username)
 
             await page.wait_for_selector('input#password', state='attached')
-            await page.fill('input#password', config.passwd)
+            await page.fill('input#password', tenant.passwd)
 
             # screenshot
-            await page.screenshot(path='./screenshots/step-2a-cas-login-form-filled.png')
+            await capture.snap(page, 'step-2a-cas-login-form-filled', tenant)
             
             submit_button_selector = 'input[name="submit"].btn.btn-block.btn-submit'
             #waiting for button to become visible
@@ -401,6 +420,7 @@ async def login_cas(page, context) -> bool:
                 raise Exception("Submit button not --visible--, despite filling in fields. Logs:\n", e)
             
             button_element = await page.query_selector(submit_button_selector)
+            await governor.acquire(tenant)
             try:
                 if await button_element.is_enabled():
                     await button_element.click()
@@ -409,7 +429,7 @@ async def login_cas(page, context) -> bool:
                 
             await page.wait_for_load_state('commit')
 
-            await page.screenshot(path='./screenshots/step-3-cas-login.png')
+            await capture.snap(page, 'step-3-cas-login', tenant)
 
             # wait for page to settle
             #wait 2 seconds
@@ -419,22 +439,24 @@ async def login_cas(page, context) -> bool:
             await page.wait_for_load_state('domcontentloaded')
             # screenshot
             # print("Attempting to login CAS, page navigated")
-            await page.screenshot(path='./screenshots/step-4-cas-login.png')
+            await capture.snap(page, 'step-4-cas-login', tenant)
+            metrics.STAGE_SECONDS.observe(time.perf_counter() - cas_started, stage="cas_login")
 
             #if we've reached this point, we have the two possibilities:
             # 1. We are DUO authenticated
             # 2. We are not DUO authenticated
             # observing redirect logic, if we were DUO authed, we would be redirected to GOLD so just page url starts with gold url, else if "Duo" in await page.title(): then auth.
             if "Duo" in await page.title():
-                return await duo_auth_hopt(page, context)
-            elif "Login Successful" in await page.title() or page.url.startswith("https://my.sa.ucsb.edu/gold/"):
+                with metrics.stage("duo_hotp"):
+                    return await duo_auth_hopt(page, context, tenant)
+            elif "Login Successful" in await page.title() or page.url.startswith(config.GOLD_URL + "/"):
                 return True
             #https://my.sa.ucsb.edu/gold/BasicFindCourses.aspx
             
         raise Exception(f"CAS Login Failed, unexpected state: {await page.title()}")
 
     except Exception as e:
-        await handle_error("Error in login_cas", e, "")
+        await handle_error("Error in login_cas", e, "", tenant)
         return False
 
 
@@ -444,5 +466,7 @@ async def save_page_content(page, name='page.html'):
 
 
 def start_health_server():
-    # Run the FastAPI server using Uvicorn
+    # Run the FastAPI server using Uvicorn, imported here so they load in the health server thread
+    import uvicorn
+    from health_server import app
     uvicorn.run(app, host="0.0.0.0", port=5000, log_level="info")
@@ -0,0 +1,150 @@
+# watchlist.py
+# What each tenant watches, kept in WATCHLIST_PATH instead of config.py so it
+# can change while the scanner runs. The file is checked every
+# WATCHLIST_CHECK_INTERVAL and applied live, and the control endpoints in
+# health_server.py edit the same file. A change reaches the poll loop on its
+# next cycle; the browser session is not touched.
+#
+#   {"default": {"courses": [{"quarter": "20251", "subject": "PSTAT", "course": "120B", "sections": ["42747"]}],
+#                "paused": [],
+#                "catalog": [{"quarter": "20251", "subject": "PSTAT", "min_course": 100, "max_course": 199}]}}
+#
+# A course may add "priority": "background" to yield to the others under the
+# request budget, see governor.py.
+# Created from config.WATCHLIST / config.TENANTS on the first run.
+
+import asyncio
+import json
+import os
+import threading
+import config
+import history
+import tenants
+
+# the file is edited from the health server thread and reloaded from the event loop
+_lock = threading.Lock()
+_mtime = None
+
+
+def course_key(entry) -> tuple:
+    return (str(entry["quarter"]), entry["subject"].upper(), entry["course"].upper())
+
+
+def seed() -> dict:
+    """File content for the watchlists currently configured in config.py."""
+    return {
+        tenant.name: {
+            "courses": [
+                {"quarter": quarter, "subject": subject, "course": course, "sections": list(sections),
+                 "priority": "background" if (quarter, subject, course) in tenant.background_courses else "high"}
+                for (quarter, subject, course), sections in tenant.watchlist.items()
+            ],
+            "paused": sorted(tenant.paused),
+            "catalog": tenant.catalog,
+        }
+        for tenant in tenants.registry.values()
+    }
+
+
+def read() -> dict:
+    with open(config.WATCHLIST_PATH, 'r') as f:
+        return json.load(f)
+
+
+def write(data):
+    tmp = config.WATCHLIST_PATH + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(data, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, config.WATCHLIST_PATH)
+
+
+def apply(data):
+    """Give every configured tenant its watchlist from `data`, without the paused sections."""
+    for name in data:
+        if name not in tenants.registry:
+            print(f"Watchlist entry {name!r} has no configured tenant, skipped")
+    for name, tenant in tenants.registry.items():
+        entry = data.get(name, {})
+        paused = set(entry.get("paused", []))
+        watchlist = {}
+        background = set()
+        for course in entry.get("courses", []):
+            sections = [section for section in course["sections"] if section not in paused]
+            if sections:
+                watchlist[course_key(course)] = sections
+            if course.get("priority", "high") == "background":
+                background.add(course_key(course))
+        tenant.set_watchlist(watchlist, paused, entry.get("catalog", []), background)
+        # an unchanged page may now hold an unpaused or newly added section
+        history.store().forget_pages(name)
+
+
+def load() -> bool:
+    """Apply the file if it changed since the last load. True if it did. On the event loop thread."""
+    tenants.load_all()
+    with _lock:
+        if not os.path.exists(config.WATCHLIST_PATH):
+            write(seed())
+    return apply_changed(read_changed())
+
+
+def read_changed():
+    """(mtime, content) of the file if it changed since the last load, else None. Only file I/O, safe off the loop."""
+    global _mtime
+    with _lock:
+        mtime = os.stat(config.WATCHLIST_PATH).st_mtime_ns
+        if mtime == _mtime:
+            return None
+        try:
+            return mtime, read()
+        except ValueError as e:
+            # a half-edited file, said once until it changes again
+            _mtime = mtime
+            print(f"Could not apply {config.WATCHLIST_PATH}, keeping the current watchlist: {e!r}")
+            return None
+
+
+def apply_changed(found) -> bool:
+    """Apply what read_changed() found. On the event loop thread: new tenants open the history store."""
+    global _mtime
+    if found is None:
+        return False
+    mtime, data = found
+    tenants.load_all()
+    with _lock:
+        if _mtime is not None and os.stat(config.WATCHLIST_PATH).st_mtime_ns != mtime:
+            # edited again meanwhile (the control API applies its own edits), the next check reads that
+            return False
+        _mtime = mtime
+        try:
+            apply(data)
+        except (KeyError, TypeError, AttributeError) as e:
+            # a half-edited file, keep polling what we had until it is fixed
+            print(f"Could not apply {config.WATCHLIST_PATH}, keeping the current watchlist: {e!r}")
+            return False
+        return True
+
+
+def edit(change) -> dict:
+    """Read the file, let `change(data)` modify it, write it back and apply it. For the control API."""
+    global _mtime
+    with _lock:
+        data = read()
+        change(data)
+        write(data)
+        apply(data)
+        _mtime = os.stat(config.WATCHLIST_PATH).st_mtime_ns
+        return data
+
+
+async def watch():
+    while True:
+        await asyncio.sleep(config.WATCHLIST_CHECK_INTERVAL)
+        try:
+            # only the file is read in a thread, tenants and the history store stay on the loop
+            if apply_changed(await asyncio.to_thread(read_changed)):
+                print(f"Reloaded {config.WATCHLIST_PATH}")
+        except OSError as e:
+            print(f"Could not read {config.WATCHLIST_PATH}: {e}")